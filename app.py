@@ -1,12 +1,10 @@
 import streamlit as st
 import time
+import uuid
+import functools
 import logging
-from database import init_firebase
-from models import load_embed_model
-
-from recommenders import RuleBasedRecommender, VectorRecommender
-from bot_engine import EscapeBotEngine
-from config import GROQ_API_KEY, TAVILY_API_KEY
+from worker_client import RemoteBotEngine, WorkerUnavailable, WorkerBusy, WorkerError
+from config import GROQ_API_KEY, WORKER_URL, WORKER_REQUEST_TIMEOUT
 
 # --------------------------------------------------------------------------
 # [로깅 설정] 앱 콘솔(터미널) 확인용
@@ -68,31 +66,140 @@ def show_guide():
     * 에러 발생, 원치않는 결과가 나올시 "대화 지우기", "새로 고침" 후 재입력 부탁드립니다.
     """)
 
-def render_cards(card_list):
-    """테마 카드 리스트를 렌더링하는 헬퍼 함수"""
-    if not card_list:
-        st.caption("결과가 없습니다.")
-        return
+@st.cache_resource
+def load_remote_engine():
+    return RemoteBotEngine(WORKER_URL, timeout=WORKER_REQUEST_TIMEOUT)
 
-    for item in card_list:
-        # 설명이 없으면 빈 문자열 처리
-        desc = item.get('desc', '')
-        # [Fix] rating 변수 정의 (딕셔너리에서 안전하게 가져오기)
-        rating = item.get('rating', 0.0)
+@st.cache_resource
+def load_local_engine():
+    """워커가 없을 때만 사용하는 인프로세스 엔진 (모델/카탈로그를 이 프로세스에 로드)"""
+    from worker import build_engine
+    return build_engine()
 
-        # 설명 길이 제한
-        if len(desc) > 100:
-            desc = desc[:100] + "..."
-        
-        # white-space: pre-wrap을 적용하여 줄바꿈을 유지하고 텍스트가 영역을 넘어갈 때 자동 줄바꿈되도록 함
-        st.markdown(f"""
+def get_bot_engine():
+    remote = load_remote_engine()
+    if remote.is_healthy():
+        return remote
+    local = load_local_engine()
+    if not local:
+        st.error("🔥 Firebase 연결 실패. 서비스 계정 키 또는 Secrets 설정을 확인하세요.")
+        st.stop()
+    return local
+
+def _call_engine(engine, prompt, nickname, session_ctx, profile=False):
+    """-> (응답 튜플, 프로파일 딕셔너리 또는 None). 프로파일링은 요청을 실제로 처리하는 엔진 안에서 수행"""
+    if not profile:
+        return engine.generate_reply(prompt, user_context=nickname, session_context=session_ctx), None
+    if isinstance(engine, RemoteBotEngine):
+        return engine.generate_profiled_reply(prompt, user_context=nickname, session_context=session_ctx)
+    from profiler import profile_call, profile_payload
+    result, prof = profile_call(engine.generate_reply, prompt, user_context=nickname, session_context=session_ctx)
+    return result, profile_payload(prof)
+
+def run_generate_reply(prompt, nickname, session_ctx, profile=False):
+    """
+    워커 우선 호출, 연결 실패 시에만 인프로세스 엔진으로 대체 (과부하/처리 실패는 에러 응답)
+    -> (응답 튜플, 프로파일 또는 None). profile=True면 디버그용으로 그 요청을 프로파일링합니다.
+    """
+    engine = get_bot_engine()
+    try:
+        result, prof = _call_engine(engine, prompt, nickname, session_ctx, profile)
+    except WorkerBusy:
+        return ("⏳ 지금 요청이 많아요. 잠시 후 다시 시도해주세요.", {}, {}, "error", {}), None
+    except WorkerError as e:
+        logger.warning(f"추천 워커 처리 실패: {e}")
+        return ("⚠️ 추천 처리 중 문제가 발생했어요. 잠시 후 다시 시도해주세요.", {}, {}, "error", {}), None
+    except WorkerUnavailable:
+        logger.warning("추천 워커 연결 실패 - 인프로세스 엔진으로 처리합니다.")
+        local = load_local_engine()
+        if not local:
+            return ("⚠️ 추천 엔진을 사용할 수 없습니다.", {}, {}, "error", {}), None
+        result, prof = _call_engine(local, prompt, nickname, session_ctx, profile)
+    if prof: prof = {"id": uuid.uuid4().hex, **prof}
+    return result, prof
+
+def render_profile(profile):
+    """프로파일 요약 + 다운로드 (collapsed stack은 flamegraph.pl / speedscope로 열 수 있음)"""
+    report = profile["report"]
+    with st.expander(f"⏱️ 프로파일 ({report['wall_ms']:.0f}ms, 샘플 {report['samples']}개)"):
+        if report["io"]:
+            st.caption("외부 호출 시간")
+            st.dataframe([{"호출": k, **v} for k, v in report["io"].items()], hide_index=True)
+        st.caption("상위 함수 (self 샘플 기준)")
+        st.dataframe(report["top"], hide_index=True)
+        col1, col2 = st.columns(2)
+        col1.download_button("📥 collapsed stack", profile["collapsed"], file_name="profile.collapsed.txt",
+                             key=f"collapsed_{profile['id']}")
+        col2.download_button("📥 JSON 리포트", profile["json"], file_name="profile.json",
+                             mime="application/json", key=f"profile_json_{profile['id']}")
+
+# 카드/탭까지 모두 그리는 최근 메시지 수 (그 이전은 한 줄 요약으로 접음)
+HISTORY_WINDOW = 8
+# 세션에 보관하는 카드 필드 (메시지에는 테마 ID만 저장)
+CARD_FIELDS = ('title', 'store', 'location', 'rating', 'desc')
+
+@functools.lru_cache(maxsize=2048)
+def card_html(theme_id, title, store, location, rating, desc):
+    """테마 카드 HTML (테마 ID + 내용 기준으로 프로세스 전체에서 재사용)"""
+    # white-space: pre-wrap을 적용하여 줄바꿈을 유지하고 텍스트가 영역을 넘어갈 때 자동 줄바꿈되도록 함
+    return f"""
         <div class='theme-card'>
-            <div class='theme-title'>{item['title']} <span style='font-size:0.8em; color:black'>({item['store']})</span></div>
-            <div class='theme-meta'>⭐ 평점: {rating:.2f} | 📍 {item['location']}</div>
+            <div class='theme-title'>{title} <span style='font-size:0.8em; color:black'>({store})</span></div>
+            <div class='theme-meta'>⭐ 평점: {rating:.2f} | 📍 {location}</div>
             <hr style="margin: 8px 0; opacity: 0.2;">
             <div class='theme-desc' style='white-space: pre-wrap; line-height: 1.5;'>{desc}</div>
         </div>
-        """, unsafe_allow_html=True)
+        """
+
+def store_cards(result_cards):
+    """결과 카드는 세션에 테마당 한 번만 보관하고, 메시지에는 테마 ID 목록만 남깁니다."""
+    theme_cards = st.session_state.theme_cards
+    refs = {}
+    for key, card_list in result_cards.items():
+        refs[key] = []
+        for item in card_list:
+            # 인프로세스 엔진은 models.Theme 참조, 워커는 JSON 딕셔너리를 돌려줌
+            if hasattr(item, 'to_dict'): item = item.to_dict()
+            # 설명이 없으면 빈 문자열 처리, 설명 길이 제한
+            desc = item.get('desc') or ''
+            if len(desc) > 100:
+                desc = desc[:100] + "..."
+            theme_cards[item['id']] = {
+                'title': item.get('title'),
+                'store': item.get('store'),
+                'location': item.get('location'),
+                'rating': float(item.get('rating') or 0.0),
+                'desc': desc,
+            }
+            refs[key].append(item['id'])
+    return refs
+
+def render_cards(theme_ids):
+    """테마 ID 리스트를 카드로 렌더링하는 헬퍼 함수"""
+    theme_cards = st.session_state.theme_cards
+    items = [(tid, theme_cards[tid]) for tid in theme_ids or [] if tid in theme_cards]
+    if not items:
+        st.caption("결과가 없습니다.")
+        return
+
+    html = "".join(card_html(tid, *(card[f] for f in CARD_FIELDS)) for tid, card in items)
+    st.markdown(html, unsafe_allow_html=True)
+
+def render_history_summary(messages):
+    """오래된 대화는 카드 없이 한 줄씩만 보여줍니다."""
+    lines = []
+    for msg in messages:
+        icon = "🙋" if msg["role"] == "user" else "🕵️"
+        text = msg["content"].strip()
+        first_line = text.splitlines()[0].lstrip("#* ").strip() if text else ""
+        if len(first_line) > 60:
+            first_line = first_line[:60] + "..."
+        n_cards = sum(len(ids) for ids in msg.get("cards", {}).values())
+        suffix = f" (추천 {n_cards}개)" if n_cards else ""
+        lines.append(f"{icon} {first_line}{suffix}")
+
+    with st.expander(f"🗂️ 이전 대화 {len(messages)}개"):
+        st.text("\n".join(lines))
 
 def main():
     with st.sidebar:
@@ -115,12 +222,16 @@ def main():
             st.info("닉네임을 입력하면 맞춤 추천이 가능합니다.")
             
         st.divider()
-        # debug_mode = st.toggle("🐛 디버그 모드", value=False, help="봇의 의도 분석 결과와 필터 정보를 보여줍니다.")
+        debug_mode = st.toggle("🐛 디버그 모드", value=False, help="봇의 의도 분석 결과와 필터 정보를 보여줍니다.")
+        profile_mode = debug_mode and st.toggle("⏱️ 요청 프로파일링", value=False,
+                                                help="다음 요청을 처리하는 엔진(워커) 안에서 샘플링 프로파일링합니다. (Firestore/Groq 호출 시간 포함)")
         
         if st.button("🗑️ 대화 초기화"):
             st.session_state.messages = []
             st.session_state.shown_theme_ids = set()
             st.session_state.last_filters = {}
+            st.session_state.theme_cards = {}
+            st.session_state.session_id = uuid.uuid4().hex
             st.rerun()
 
     if page == "📖 가이드":
@@ -161,21 +272,21 @@ def main():
         st.session_state.shown_theme_ids = set()
     if "last_filters" not in st.session_state:
         st.session_state.last_filters = {}
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    if "theme_cards" not in st.session_state:
+        st.session_state.theme_cards = {}
 
-    # 리소스 로드
-    db = init_firebase()
-    embed_model = load_embed_model()
+    # 추천 엔진 (워커 또는 인프로세스)
+    get_bot_engine()
 
-    if not db:
-        st.error("🔥 Firebase 연결 실패. 서비스 계정 키 또는 Secrets 설정을 확인하세요.")
-        st.stop()
-    
-    vec_rec = VectorRecommender(db, embed_model)
-    rule_rec = RuleBasedRecommender(db) 
-    bot_engine = EscapeBotEngine(vec_rec, rule_rec, GROQ_API_KEY, TAVILY_API_KEY)
+    # 채팅 기록 표시 (최근 HISTORY_WINDOW개만 전체 렌더링)
+    history = st.session_state.messages
+    if len(history) > HISTORY_WINDOW:
+        render_history_summary(history[:-HISTORY_WINDOW])
+        history = history[-HISTORY_WINDOW:]
 
-    # 채팅 기록 표시
-    for msg in st.session_state.messages:
+    for msg in history:
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
             
@@ -190,7 +301,9 @@ def main():
 
             if cards:
                 # 탭 구성
-                tab1, tab2 = st.tabs(["🔎 조건 추천", "🎯 맞춤 추천"])
+                tab_names = ["🔎 조건 추천", "🎯 맞춤 추천"]
+                if 'hybrid' in cards: tab_names.append("🔀 통합 추천")
+                tab1, tab2, *tab_rest = st.tabs(tab_names)
                 with tab1:
                     # Rule-based 결과 표시
                     rule_list = cards.get('rule_based', [])
@@ -211,10 +324,18 @@ def main():
                         render_cards(cards['personalized'])
                     else:
                         st.caption("맞춤 추천 결과가 없습니다. (로그인 필요)")
+
+                if tab_rest:
+                    with tab_rest[0]:
+                        # 조건 순위와 취향 유사도 순위를 합친 단일 랭킹
+                        render_cards(cards['hybrid'])
             
-            # if debug_mode and debug_info:
-            #     with st.expander("🛠️ 디버그 정보"):
-            #         st.json(debug_info)
+            if debug_mode and debug_info:
+                with st.expander("🛠️ 디버그 정보"):
+                    st.json(debug_info)
+
+            if debug_mode and msg.get("profile"):
+                render_profile(msg["profile"])
 
     # 사용자 입력 처리
     if prompt := st.chat_input("메시지를 입력하세요..."):
@@ -236,21 +357,20 @@ def main():
                     #     logger.info(msg)
 
                     session_ctx = {
+                        'session_id': st.session_state.session_id,
                         'shown_ids': st.session_state.shown_theme_ids,
                         'last_filters': st.session_state.last_filters
                     }
 
                     # 봇 엔진 실행
-                    reply_text, result_cards, used_filters, action, debug_data = bot_engine.generate_reply(
-                        prompt, 
-                        user_context=nickname,
-                        session_context=session_ctx,
-                        # on_log=ui_logger
+                    (reply_text, result_cards, used_filters, action, debug_data), profile = run_generate_reply(
+                        prompt, nickname, session_ctx, profile=profile_mode
                     )
                     
                     status.update(label="추리 완료!", state="complete", expanded=False)
 
                 st.markdown(reply_text)
+                card_refs = store_cards(result_cards)
                 
                 # 중복 추천 방지 업데이트
                 if result_cards:
@@ -258,16 +378,16 @@ def main():
                         st.session_state.shown_theme_ids = set()
                     st.session_state.last_filters = used_filters
                     
-                    for key in result_cards:
-                        for c in result_cards[key]:
-                            st.session_state.shown_theme_ids.add(c['id'])
+                    for theme_ids in card_refs.values():
+                        st.session_state.shown_theme_ids.update(theme_ids)
 
         # 대화 저장
         st.session_state.messages.append({
             "role": "assistant", 
             "content": reply_text,
-            "cards": result_cards,
-            # "debug_info": debug_data if debug_mode else {},
+            "cards": card_refs,
+            "debug_info": debug_data if debug_mode else {},
+            "profile": profile,
             "logs": process_logs
         })
         st.rerun()
@@ -1,9 +1,15 @@
 import json
 import re
-from groq import Groq
+from groq import Groq, RateLimitError
 from tavily import TavilyClient
 from database import firestore, FieldFilter
 from utils import sort_candidates_by_query
+from caches import RankedCursor, RankedCursorCache, ResultCache, normalize_users
+from catalog import DescriptionStore
+from play_history import write_played
+from config import LLM_QUEUE_DEADLINE, LLM_PLAY_RECORD_DEADLINE
+from intent_classifier import LocalIntentClassifier, is_play_record
+from llm_scheduler import LLMBudgetExceeded, PRIORITY_PLAY_RECORD, PRIORITY_RECOMMEND, estimate_tokens
 
 # ==============================================================================
 # [지역 데이터베이스]
@@ -23,11 +29,23 @@ for group in AREA_GROUPS:
     ALL_LOCATIONS.extend(group['locations'])
 ALL_LOCATIONS = list(set(ALL_LOCATIONS))
 
+# 한 번에 보여주는 카드 수 / 커서로 미리 정렬해 두는 깊이
+PAGE_SIZE = 3
+CURSOR_DEPTH = 30
+
 class EscapeBotEngine:
-    def __init__(self, vector_recommender, rule_recommender, groq_key, tavily_key):
+    def __init__(self, vector_recommender, rule_recommender, groq_key, tavily_key, cursor_cache=None, catalog=None,
+                 hybrid_recommender=None, intent_classifier=None, llm_scheduler=None, result_cache=None):
         self.vector_recommender = vector_recommender
         self.rule_recommender = rule_recommender 
+        self.hybrid_recommender = hybrid_recommender
+        self.intent_classifier = intent_classifier
         self.db = rule_recommender.db
+        self.catalog = catalog
+        self.descriptions = DescriptionStore(self.db, catalog)
+        self.cursor_cache = cursor_cache if cursor_cache is not None else RankedCursorCache()
+        self.result_cache = result_cache if result_cache is not None else ResultCache()
+        self.llm_scheduler = llm_scheduler
         
         self.tavily_client = TavilyClient(api_key=tavily_key) if tavily_key else None
         
@@ -43,8 +61,12 @@ class EscapeBotEngine:
         cleaned = re.sub(r"```", "", cleaned)
         return cleaned.strip()
 
-    def _call_llm(self, prompt, json_mode=False):
+    def _call_llm(self, prompt, json_mode=False, priority=PRIORITY_RECOMMEND):
+        """할당량 안에서 기한 내에 보낼 수 없으면 LLMBudgetExceeded, 그 외 실패는 None"""
         if not self.groq_client: return None
+        if self.llm_scheduler:
+            max_wait = LLM_PLAY_RECORD_DEADLINE if priority == PRIORITY_PLAY_RECORD else LLM_QUEUE_DEADLINE
+            self.llm_scheduler.acquire(estimate_tokens(prompt), priority=priority, max_wait=max_wait)
         try:
             chat_completion = self.groq_client.chat.completions.create(
                 messages=[
@@ -62,6 +84,12 @@ class EscapeBotEngine:
                 response_format={"type": "json_object"} if json_mode else None,
             )
             return chat_completion.choices[0].message.content
+        except RateLimitError as e:
+            if self.llm_scheduler:
+                try: retry_after = float(e.response.headers.get('retry-after'))
+                except (TypeError, ValueError, AttributeError): retry_after = None
+                self.llm_scheduler.report_rate_limited(retry_after)
+            return None
         except Exception as e:
             return None
 
@@ -91,7 +119,7 @@ class EscapeBotEngine:
             if location:
                 query = query.where(filter=FieldFilter("location", "==", location))
             
-            docs = list(query.limit(2000).stream())
+            docs = list(query.select(['title', 'letters', 'ref_id']).limit(2000).stream())
             target_name = theme_name.replace(" ", "")
             
             for doc in docs:
@@ -110,6 +138,18 @@ class EscapeBotEngine:
             if on_log: on_log(f"   ⚠️ 검색 에러: {e}")
             return None
 
+    def _invalidate_user_caches(self, nickname):
+        topk_store = getattr(self.vector_recommender, 'topk_store', None)
+        if topk_store: topk_store.invalidate(nickname)
+        self.result_cache.invalidate_users(nickname)
+
+    def _user_state(self, user_context):
+        """결과 캐시 키용 유저 상태 지문 (유저 인덱스가 없거나 미등록 유저면 None)"""
+        users = normalize_users(user_context)
+        user_index = getattr(self.vector_recommender, 'user_index', None)
+        if not users or not user_index: return None
+        return user_index.state_digest(users)
+
     def update_play_history(self, nickname, theme_id, action, on_log=None):
         try:
             users_ref = self.db.collection('users')
@@ -119,19 +159,32 @@ class EscapeBotEngine:
             if not docs: return "❌ 유저 미등록"
             
             user_doc = docs[0]
+            if action not in ("played_check", "not_played_check"): return "알 수 없는 요청"
+
+            user_index = getattr(self.vector_recommender, 'user_index', None)
+            played = write_played(self.db, user_doc.reference, theme_id, played=(action == "played_check"))
+            # 리스너 반영 전 다음 메시지에서도 바로 제외되도록 인덱스에 즉시 적용
+            if user_index: user_index.set_played(nickname, played)
+            # 쓰기 도중 다른 요청이 옛 기록으로 채운 항목까지 지우도록 인덱스 갱신 뒤에 무효화
+            self._invalidate_user_caches(nickname)
+
             if action == "played_check":
-                user_doc.reference.update({"played": firestore.ArrayUnion([theme_id])})
-                if on_log: on_log(f"[기록] {nickname}님 플레이 리스트에 {theme_id} 추가")
+                if on_log: on_log(f"[기록] {nickname}님 플레이 리스트에 {theme_id} 추가 (총 {len(played)}개)")
                 return "추가 완료"
-            elif action == "not_played_check":
-                user_doc.reference.update({"played": firestore.ArrayRemove([theme_id])})
-                if on_log: on_log(f"[기록] {nickname}님 플레이 리스트에서 {theme_id} 삭제")
-                return "삭제 완료"
-            return "알 수 없는 요청"
+            if on_log: on_log(f"[기록] {nickname}님 플레이 리스트에서 {theme_id} 삭제 (총 {len(played)}개)")
+            return "삭제 완료"
         except Exception as e:
             return f"에러: {e}"
 
     def analyze_user_intent(self, user_query, on_log=None):
+        # 1단계: 로컬 임베딩 분류기로 확신할 수 있으면 LLM 호출 없이 반환
+        if self.intent_classifier:
+            result = self.intent_classifier.analyze(user_query)
+            if result:
+                result['locations'] = self._extract_locations_from_text(user_query, on_log)
+                if on_log: on_log(f"[Local] 의도 분석 완료: {result['action']} (유사도 {result['confidence']}), 지역: {result['locations']}")
+                return result
+
         if on_log: on_log(f"[LLM] 사용자 의도 분석 중... ('{user_query}')")
         
         if not self.groq_client: return {}
@@ -158,8 +211,16 @@ class EscapeBotEngine:
         
         Return JSON only.
         """
+        priority = PRIORITY_PLAY_RECORD if is_play_record(user_query) else PRIORITY_RECOMMEND
+        try:
+            result_str = self._call_llm(prompt, json_mode=True, priority=priority)
+        except LLMBudgetExceeded as e:
+            if on_log: on_log(f"   ⏳ {e} -> 로컬 분석으로 처리")
+            return self._local_fallback(user_query, on_log, reason="llm_budget")
+        if not result_str:
+            return self._local_fallback(user_query, on_log, reason="llm_error")
+
         try:
-            result_str = self._call_llm(prompt, json_mode=True)
             cleaned_str = self._clean_json_string(result_str)
             result = json.loads(cleaned_str)
             
@@ -182,6 +243,96 @@ class EscapeBotEngine:
             locs = self._extract_locations_from_text(user_query)
             return {"action": "recommend", "keywords": [user_query], "locations": locs}
 
+    def _local_fallback(self, user_query, on_log=None, reason="llm_error"):
+        """
+        LLM 없이 의도 분석 (할당량 소진 / 호출 실패 시).
+        결과의 'fallback'에 사유("llm_budget" = 스케줄러 기한 초과, "llm_error" = 호출 실패)를 남깁니다.
+        """
+        classifier = self.intent_classifier or LocalIntentClassifier(None)
+        result = classifier.fallback(user_query, ALL_LOCATIONS)
+        if not result:
+            return {"action": "recommend", "keywords": [user_query], "locations": self._extract_locations_from_text(user_query),
+                    "fallback": reason}
+
+        result['fallback'] = reason
+        result['locations'] = self._extract_locations_from_text(user_query, on_log)
+        for item in result['items']:
+            if not item.get('location') and result['locations']:
+                item['location'] = result['locations'][0]
+        if on_log: on_log(f"[Local] 대체 의도 분석: {result['action']}, 지역: {result['locations']}")
+        return result
+
+    def _rank_candidates(self, filters_to_use, user_query, final_context, exclude_ids, on_log=None):
+        """
+        커서용 깊은 랭킹을 한 번에 계산합니다.
+        {result_key: (정렬된 후보 리스트, 재정렬 윈도우, 소스가 전부 소진되었는지)}
+        """
+        rankings = {}
+        # 페이지마다 (유사도 상위 PAGE_SIZE*5개 -> 키워드 재정렬) 하던 동작을 그대로 재현하기 위해
+        # 유사도 순 리스트를 받아두고 _paginate에서 윈도우 단위로 재정렬합니다.
+        window = PAGE_SIZE * 5 if user_query else None
+        fetch = CURSOR_DEPTH + (window or PAGE_SIZE)
+
+        if self.hybrid_recommender:
+            # 하이브리드 모드: 필터 마스크 1회 -> 조건/유사도/RRF 랭킹을 한 번에 계산
+            ranked = self.hybrid_recommender.rank(
+                filters_to_use, user_query, final_context, exclude_ids, limit=CURSOR_DEPTH, vector_limit=fetch, log_func=on_log
+            )
+            if ranked.get('rule_based'):
+                rankings['rule_based'] = (ranked['rule_based'], None, len(ranked['rule_based']) < CURSOR_DEPTH)
+            if ranked.get('personalized'):
+                rankings['personalized'] = (ranked['personalized'], window, len(ranked['personalized']) < fetch)
+            if ranked.get('hybrid'):
+                rankings['hybrid'] = (ranked['hybrid'], None, len(ranked['hybrid']) < CURSOR_DEPTH)
+            return rankings or self._rank_text(filters_to_use, user_query, exclude_ids, on_log)
+
+        rule_list = self.rule_recommender.search_themes(
+            filters_to_use, user_query, limit=CURSOR_DEPTH, nicknames=final_context, exclude_ids=exclude_ids, log_func=on_log
+        )
+        if rule_list: rankings['rule_based'] = (rule_list, None, len(rule_list) < CURSOR_DEPTH)
+
+        if final_context:
+            vector_list = self.vector_recommender.recommend_by_user_search(
+                final_context, user_query="", limit=fetch, filters=filters_to_use, exclude_ids=exclude_ids, log_func=on_log
+            )
+            if vector_list: rankings['personalized'] = (vector_list, window, len(vector_list) < fetch)
+
+        return rankings or self._rank_text(filters_to_use, user_query, exclude_ids, on_log)
+
+    def _rank_text(self, filters_to_use, user_query, exclude_ids, on_log=None):
+        """조건/맞춤 결과가 모두 없을 때의 텍스트 임베딩 유사 검색 랭킹"""
+        text_list = self.vector_recommender.recommend_by_text(
+            user_query, limit=CURSOR_DEPTH + 10, filters=filters_to_use, exclude_ids=exclude_ids, log_func=on_log
+        )
+        if not text_list: return {}
+        return {'text_search': (text_list, 10, len(text_list) < CURSOR_DEPTH + 10)}
+
+    def _paginate(self, rankings, user_query):
+        """
+        "다른거 추천해줘"를 반복했을 때와 같은 순서가 되도록 페이지를 미리 잘라 둡니다.
+        이전 페이지에서 (어느 탭이든) 보여준 테마는 다음 페이지 후보에서 빠집니다.
+        후보가 잘린 랭킹(소진되지 않은 소스)은 남은 개수가 윈도우보다 적어지면 거기서 멈춥니다.
+        """
+        pools = {key: list(ranking[0]) for key, ranking in rankings.items()}
+        pages, shown = [], set()
+
+        while True:
+            page = {}
+            for key, (_, window, exhausted) in rankings.items():
+                remaining = [c for c in pools[key] if c.id not in shown]
+                pools[key] = remaining
+                need = window or PAGE_SIZE
+                if len(remaining) < need and not exhausted:
+                    return pages
+                head = remaining[:need]
+                if window: head = sort_candidates_by_query(list(head), user_query)
+                if head: page[key] = head[:PAGE_SIZE]
+
+            if not page: return pages
+            pages.append(page)
+            for cards in page.values():
+                shown.update(c.id for c in cards)
+
     def generate_reply(self, user_query, user_context=None, session_context=None, on_log=None):
         if not self.groq_client:
             return "⚠️ API Key 설정 필요", {}, {}, "error", {}
@@ -251,28 +402,39 @@ class EscapeBotEngine:
 
         if on_log: on_log(f"필터 적용: {filters_to_use}, 제외 ID: {len(exclude_ids)}개")
 
-        final_results = {}
-        
-        candidates_rule = self.rule_recommender.search_themes(
-            filters_to_use, user_query, limit=3, nicknames=final_context, exclude_ids=exclude_ids, log_func=on_log
-        )
-        if candidates_rule: final_results['rule_based'] = candidates_rule
+        session_id = (session_context or {}).get('session_id')
+        catalog_version = self.catalog.version if self.catalog else None
+        cursor_key = RankedCursorCache.make_key(filters_to_use, final_context, catalog_version)
 
-        if final_context:
-            candidates_vector = self.vector_recommender.recommend_by_user_search(
-                final_context, user_query=user_query, limit=3, filters=filters_to_use, exclude_ids=exclude_ids, log_func=on_log
-            )
-            if candidates_vector:
-                final_results['personalized'] = candidates_vector
+        final_results = None
+        if action == 'another_recommend':
+            cursor = self.cursor_cache.get(session_id, cursor_key)
+            final_results = cursor.next_page() if cursor else None
+            if final_results and on_log: on_log(f"   -> [Cursor] 저장된 랭킹의 {cursor.position}번째 페이지 반환")
+            debug_info['cursor'] = "hit" if final_results else "miss"
 
         if not final_results:
-            candidates_text = self.vector_recommender.recommend_by_text(
-                user_query, filters=filters_to_use, exclude_ids=exclude_ids, log_func=on_log
-            )
-            if candidates_text:
-                final_results['text_search'] = sort_candidates_by_query(candidates_text, user_query)[:3]
+            # 같은 조건/유저/제외 목록이면 다른 세션이 만든 페이지를 그대로 사용
+            result_key = ResultCache.make_key(filters_to_use, final_context, exclude_ids, catalog_version, user_query,
+                                              self._user_state(final_context))
+            pages = self.result_cache.get(result_key)
+            debug_info['result_cache'] = "hit" if pages is not None else "miss"
+            if pages is not None:
+                if on_log: on_log("   -> [Cache] 동일 조건 추천 결과 재사용")
             else:
+                rankings = self._rank_candidates(filters_to_use, user_query, final_context, exclude_ids, on_log)
+                pages = self._paginate(rankings, user_query)
+                # 텍스트 유사 검색은 쿼리 문장 자체에 의존하므로 공유하지 않음
+                if 'text_search' not in rankings: self.result_cache.put(result_key, pages)
+            if not pages:
+                self.cursor_cache.drop(session_id)
                 return "조건에 맞는 테마를 찾지 못했습니다.", {}, filters_to_use, action, debug_info
+            self.cursor_cache.put(session_id, RankedCursor(cursor_key, pages))
+            final_results = pages[0]
+
+        # 화면에 나갈 카드의 설명만 지연 로드
+        for cards in final_results.values():
+            self.descriptions.fill(cards)
 
         if on_log: on_log("📝 답변 생성 중 (Fixed Template)...")
         
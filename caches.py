@@ -0,0 +1,173 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+from utils import query_sort_spec
+
+# ==============================================================================
+# [세션 커서 캐시] "다른거 추천해줘" 페이지네이션용
+# ==============================================================================
+
+def normalize_filters(filters):
+    """필터 딕셔너리를 순서와 무관한 문자열 키로 정규화합니다."""
+    normalized = {}
+    for key, value in (filters or {}).items():
+        if value in (None, "", [], {}): continue
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(str(v) for v in value)
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def normalize_users(user_context):
+    if not user_context: return ()
+    if isinstance(user_context, str):
+        user_context = user_context.split(',')
+    return tuple(sorted({u.strip() for u in user_context if u and u.strip()}))
+
+
+class RankedCursor:
+    """한 세션의 마지막 검색 결과를 페이지 단위로 보관합니다."""
+    __slots__ = ('key', 'pages', 'position')
+
+    def __init__(self, key, pages):
+        self.key = key
+        self.pages = pages      # [{result_key: [card, ...]}, ...]
+        self.position = 1       # 첫 페이지는 생성 시 이미 응답됨
+
+    def next_page(self):
+        if self.position >= len(self.pages): return None
+        page = self.pages[self.position]
+        self.position += 1
+        return page
+
+
+class RankedCursorCache:
+    """
+    세션 ID -> RankedCursor. 크기 제한(LRU) + 유휴 만료.
+    커서 키는 (정규화 필터, 유저 집합, 카탈로그 버전)이며, 키가 다르면 무효로 간주합니다.
+    """
+    def __init__(self, max_sessions=1000, ttl_seconds=1800):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._cursors = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(filters, user_context, catalog_version):
+        return (normalize_filters(filters), normalize_users(user_context), catalog_version)
+
+    def put(self, session_id, cursor):
+        if not session_id: return
+        with self._lock:
+            self._cursors[session_id] = (time.monotonic(), cursor)
+            self._cursors.move_to_end(session_id)
+            while len(self._cursors) > self.max_sessions:
+                self._cursors.popitem(last=False)
+
+    def get(self, session_id, key):
+        if not session_id: return None
+        with self._lock:
+            entry = self._cursors.get(session_id)
+            if not entry: return None
+            stamp, cursor = entry
+            if time.monotonic() - stamp > self.ttl_seconds or cursor.key != key:
+                del self._cursors[session_id]
+                return None
+            self._cursors[session_id] = (time.monotonic(), cursor)
+            self._cursors.move_to_end(session_id)
+            return cursor
+
+    def drop(self, session_id):
+        with self._lock:
+            self._cursors.pop(session_id, None)
+
+
+@st.cache_resource
+def load_cursor_cache():
+    return RankedCursorCache()
+
+
+# ==============================================================================
+# [결과 캐시] 같은 조건의 추천 결과(페이지 목록)를 세션 간 공유
+# ==============================================================================
+
+def exclusion_digest(exclude_ids):
+    if not exclude_ids: return ""
+    joined = "\n".join(sorted(str(x) for x in exclude_ids))
+    return hashlib.sha1(joined.encode('utf-8')).hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    (정규화 필터, 유저 집합, 제외 ID 지문, 정렬 기준, 카탈로그 버전, 유저 상태 지문) -> 페이지 목록.
+    크기 제한(LRU) + 만료 시간. 유저 상태 지문(UserIndex.state_digest)이 키에 들어가므로
+    다른 프로세스에서 기록된 플레이도 리스너 반영 후엔 새 키가 됩니다.
+    같은 프로세스의 쓰기는 invalidate_users로 즉시 제거합니다.
+    캐시된 페이지의 카드는 여러 세션이 공유하므로 읽기 전용으로 다뤄야 합니다.
+    """
+    def __init__(self, max_entries=512, ttl_seconds=600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(filters, user_context, exclude_ids, catalog_version, user_query="", user_state=None):
+        # 랭킹에 영향을 주는 건 쿼리 문장이 아니라 정렬 기준과 키워드 재정렬 여부
+        spec = tuple(query_sort_spec(user_query))
+        return (normalize_filters(filters), normalize_users(user_context), exclusion_digest(exclude_ids),
+                spec, bool(user_query), catalog_version, user_state)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry: self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, pages):
+        with self._lock:
+            if key in self._entries: self._remove(key)
+            self._entries[key] = (time.monotonic(), pages)
+            for user in key[1]:
+                self._keys_by_user.setdefault(user, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        for user in key[1]:
+            keys = self._keys_by_user.get(user)
+            if keys is None: continue
+            keys.discard(key)
+            if not keys: del self._keys_by_user[user]
+
+    def invalidate_users(self, user_context):
+        """해당 유저가 포함된 모든 항목 제거 -> 제거된 수"""
+        with self._lock:
+            keys = set()
+            for user in normalize_users(user_context):
+                keys.update(self._keys_by_user.get(user, ()))
+            for key in keys: self._remove(key)
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+@st.cache_resource
+def load_result_cache():
+    return ResultCache()
@@ -0,0 +1,484 @@
+import contextlib
+import hashlib
+import threading
+import time
+import numpy as np
+import streamlit as st
+
+from models import Theme
+from play_history import PLAYED_FIELDS, EMPTY_PLAYED, decode_played, normalize_played
+
+# ==============================================================================
+# [테마 카탈로그] 전체 테마를 한 번 로드해 배열 형태로 보관
+# ==============================================================================
+
+def to_vector_list(vec_obj):
+    """Firestore Vector / list 어느 쪽이든 파이썬 리스트로 변환합니다."""
+    if not vec_obj: return None
+    return vec_obj.to_map()['value'] if hasattr(vec_obj, 'to_map') else list(vec_obj)
+
+
+def normalize_rows(matrix):
+    """행별 L2 정규화 (제자리). 로드와 변경분 반영이 같은 연산을 써야 동일 벡터가 비트 단위로 같게 나옵니다."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def theme_ref_id(doc_id, data):
+    """플레이 기록에 저장되는 정수 테마 ID (ref_id 우선, 없으면 문서 ID)"""
+    try:
+        return int(data.get('ref_id') or doc_id)
+    except (TypeError, ValueError):
+        return None
+
+
+# 카드/필터에 필요한 필드 (description, embedding_field 제외)
+THEME_CARD_FIELDS = [
+    'ref_id', 'title', 'store_name', 'location', 'average_person_count',
+    'satisfyTotalRating', 'fearTotalRating', 'difficultyTotalRating', 'activityTotalRating',
+    'problemTotalRating', 'storyTotalRating', 'interiorTotalRating', 'actTotalRating',
+]
+THEME_VECTOR_FIELDS = THEME_CARD_FIELDS + ['embedding_field']
+
+
+class ThemeCatalog:
+    """
+    themes 컬렉션 전체를 메모리에 올린 카탈로그.
+    - records: Theme 레코드 (행 순서, 추천 결과는 이 객체를 그대로 참조)
+    - ref_ids: 행별 정수 테마 ID (-1 = 없음)
+    - embeddings: 행별 L2 정규화 임베딩 (임베딩 없는 행은 0 벡터)
+    - people: 행별 평균 인원 (없으면 NaN)
+    - version: 캐시 무효화용 버전 (로드 시각 ms에서 시작해 변경분 반영마다 1씩 증가)
+    배열을 여러 개 읽는 쪽은 lock을 잡고 읽어야 CatalogSync의 변경 반영과 섞이지 않습니다.
+    """
+    def __init__(self, doc_ids, records, ref_ids, embeddings, people=None, watermark=None):
+        self.doc_ids = doc_ids
+        self.records = records
+        self.ref_ids = np.asarray(ref_ids, dtype=np.int64)
+        self.embeddings = embeddings
+        self.has_embedding = np.linalg.norm(embeddings, axis=1) > 0 if len(embeddings) else np.zeros(0, dtype=bool)
+        self.people = np.asarray(people if people is not None else [np.nan] * len(doc_ids), dtype=np.float64)
+        self.version = int(time.time() * 1000)
+        self.watermark = watermark
+        self.lock = threading.RLock()
+        self._fingerprint = None
+        self._row_index = None
+        self._ref_lookup = None
+        self._fields = {}
+        self._location_masks = {}
+        self._listeners = []
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def add_change_listener(self, callback):
+        """apply_changes 후 callback(바뀐 doc_id 목록) 호출 (잠금을 잡은 채 호출되므로 짧게 처리할 것)"""
+        self._listeners.append(callback)
+
+    @staticmethod
+    def _parse(doc_id, data):
+        """문서 -> (Theme, ref_id, 벡터 리스트, 평균 인원)"""
+        try:
+            vector = to_vector_list(data.get('embedding_field'))
+        except Exception:
+            vector = None
+        tid = theme_ref_id(doc_id, data)
+        try:
+            people = float(data.get('average_person_count') or np.nan)
+        except (TypeError, ValueError):
+            people = np.nan
+        return Theme.from_doc(doc_id, data), (tid if tid is not None else -1), vector, people
+
+    @classmethod
+    def load(cls, db, log_func=None):
+        # 설명은 카드 렌더링 시점에 DescriptionStore로 따로 로드
+        docs = list(db.collection('themes').select(THEME_VECTOR_FIELDS + ['updated_at']).stream())
+
+        doc_ids, records, ref_ids, vectors, people = [], [], [], [], []
+        dim = 0
+        watermark = None
+        for doc in docs:
+            data = doc.to_dict()
+            record, tid, vector, person = cls._parse(doc.id, data)
+            if vector: dim = dim or len(vector)
+            updated_at = data.get('updated_at')
+            if updated_at and (watermark is None or updated_at > watermark): watermark = updated_at
+
+            doc_ids.append(doc.id)
+            records.append(record)
+            ref_ids.append(tid)
+            vectors.append(vector)
+            people.append(person)
+
+        embeddings = np.zeros((len(vectors), dim), dtype=np.float32)
+        for row, vector in enumerate(vectors):
+            if vector and len(vector) == dim:
+                embeddings[row] = vector
+        normalize_rows(embeddings)
+
+        if log_func: log_func(f"[Catalog] 테마 {len(doc_ids)}개 로드 (임베딩 차원 {dim})")
+        return cls(doc_ids, records, ref_ids, embeddings, people, watermark)
+
+    def _vector_row(self, vector):
+        if vector and self.embeddings.shape[1] == 0:
+            self.embeddings = np.zeros((len(self), len(vector)), dtype=np.float32)
+        row = np.zeros((1, self.embeddings.shape[1]), dtype=np.float32)
+        if vector and len(vector) == row.shape[1]:
+            row[0] = vector
+            normalize_rows(row)
+        return row[0]
+
+    def apply_changes(self, upserts=None, removals=None):
+        """
+        변경분을 배열에 제자리 반영합니다. 수정은 해당 행을 덮어쓰고,
+        추가는 뒤에 붙이고, 삭제는 행을 제거합니다. 바뀐 행이 있으면 version이 증가합니다.
+        upserts: {doc_id: 문서 데이터}, removals: 삭제된 doc_id 목록 -> 반환: 바뀐 행 수
+        """
+        with self.lock:
+            row_of = {doc_id: row for row, doc_id in enumerate(self.doc_ids)}
+            changed = 0
+            # 멤버십 / ref_id / 임베딩이 바뀔 때만 fingerprint 재계산 (평점 등 카드 필드 변경은 제외)
+            vectors_changed = False
+            added = []
+            for doc_id, data in (upserts or {}).items():
+                record, tid, vector, people = self._parse(doc_id, data)
+                vec = self._vector_row(vector)
+                row = row_of.get(doc_id)
+                if row is None:
+                    added.append((doc_id, record, tid, vec, people))
+                    continue
+                same_people = self.people[row] == people or (np.isnan(self.people[row]) and np.isnan(people))
+                if (self.records[row] == record and self.ref_ids[row] == tid and same_people
+                        and np.array_equal(self.embeddings[row], vec)):
+                    # 설명만 바뀌었을 수 있으므로 지연 로드된 설명은 비워 다시 읽게 함
+                    self.records[row].desc = ''
+                    continue
+                if self.ref_ids[row] != tid or not np.array_equal(self.embeddings[row], vec):
+                    vectors_changed = True
+                self.records[row] = record
+                self.ref_ids[row] = tid
+                self.embeddings[row] = vec
+                self.has_embedding[row] = bool(vec.any())
+                self.people[row] = people
+                changed += 1
+
+            removed_rows = sorted({row_of[doc_id] for doc_id in removals or [] if doc_id in row_of})
+            if removed_rows:
+                keep = np.ones(len(self), dtype=bool)
+                keep[removed_rows] = False
+                self.doc_ids = [d for d, k in zip(self.doc_ids, keep.tolist()) if k]
+                self.records = [r for r, k in zip(self.records, keep.tolist()) if k]
+                self.ref_ids = self.ref_ids[keep]
+                self.embeddings = self.embeddings[keep]
+                self.has_embedding = self.has_embedding[keep]
+                self.people = self.people[keep]
+                changed += len(removed_rows)
+
+            if added:
+                self.doc_ids.extend(a[0] for a in added)
+                self.records.extend(a[1] for a in added)
+                self.ref_ids = np.concatenate([self.ref_ids, np.array([a[2] for a in added], dtype=np.int64)])
+                new_vecs = np.stack([a[3] for a in added]).astype(np.float32)
+                self.embeddings = np.concatenate([self.embeddings, new_vecs]) if len(self.embeddings) else new_vecs
+                self.has_embedding = np.concatenate([self.has_embedding, new_vecs.any(axis=1)])
+                self.people = np.concatenate([self.people, np.array([a[4] for a in added], dtype=np.float64)])
+                changed += len(added)
+
+            if removed_rows or added: vectors_changed = True
+            if vectors_changed: self._fingerprint = None
+            for callback in self._listeners:
+                callback(list((upserts or {}).keys()) + list(removals or []))
+            if changed:
+                self.version += 1
+                self._row_index = None
+                self._ref_lookup = None
+                self._fields = {}
+                self._location_masks = {}
+            return changed
+
+    def field(self, name):
+        """Theme 점수 속성(rating, fear 등)의 행별 float 배열 (지연 생성 후 재사용)"""
+        values = self._fields.get(name)
+        if values is None:
+            values = np.fromiter((getattr(r, name) for r in self.records), dtype=np.float64, count=len(self.records))
+            self._fields[name] = values
+        return values
+
+    def location_mask(self, location):
+        """공백 제거 후 지역명이 포함된 행 마스크 (지역명별로 캐시)"""
+        target = location.replace(" ", "")
+        mask = self._location_masks.get(target)
+        if mask is None:
+            mask = np.array([target in (r.location or '').replace(" ", "") for r in self.records], dtype=bool)
+            self._location_masks[target] = mask
+        return mask
+
+    def filter_mask(self, filters=None, exclude_ids=None, played_ids=None):
+        """
+        지역 / 최소 평점 / 인원수(±1) / 제외 ID / 플레이 기록 조건을 만족하는 행 마스크.
+        RuleBasedRecommender / VectorRecommender의 문서 단위 필터와 같은 규칙입니다.
+        played_ids는 정렬된 정수 ref_id 배열(UserIndex)로, searchsorted로 한 번에 제외됩니다.
+        """
+        with self.lock:
+            return self._filter_mask(filters or {}, exclude_ids, played_ids)
+
+    def _filter_mask(self, filters, exclude_ids, played_ids=None):
+        mask = np.ones(len(self), dtype=bool)
+
+        locs = [loc for loc in filters.get('locations') or [] if loc.strip()]
+        if locs:
+            loc_mask = np.zeros(len(self), dtype=bool)
+            for loc in locs: loc_mask |= self.location_mask(loc)
+            mask &= loc_mask
+
+        try:
+            if filters.get('min_rating'):
+                mask &= self.field('rating') >= float(filters['min_rating'])
+        except (TypeError, ValueError):
+            pass
+
+        try:
+            if filters.get('people_count'):
+                target = float(filters['people_count'])
+                mask &= np.isnan(self.people) | (np.abs(self.people - target) <= 1)
+        except (TypeError, ValueError):
+            pass
+
+        if exclude_ids:
+            mask[self._rows_for_ids(exclude_ids)] = False
+        if played_ids is not None and len(played_ids):
+            mask[self._rows_for_ref_ids(played_ids)] = False
+        return mask
+
+    def rows_for_ref_ids(self, ref_ids):
+        """정수 ref_id 배열 -> 카탈로그 행 번호 배열 (정렬된 ref_id 캐시로 벡터화)"""
+        with self.lock:
+            return self._rows_for_ref_ids(ref_ids)
+
+    def _rows_for_ref_ids(self, ref_ids):
+        if self._ref_lookup is None:
+            order = np.argsort(self.ref_ids, kind='stable')
+            self._ref_lookup = (self.ref_ids[order], order)
+        sorted_refs, order = self._ref_lookup
+        ref_ids = np.asarray(ref_ids, dtype=np.int64)
+        ref_ids = ref_ids[ref_ids >= 0]
+        if not len(sorted_refs) or not len(ref_ids): return np.zeros(0, dtype=np.int64)
+        # 같은 ref_id를 가진 행이 여러 개일 수 있으므로 [left, right) 구간의 행을 모두 반환
+        lo = np.searchsorted(sorted_refs, ref_ids, side='left')
+        counts = np.searchsorted(sorted_refs, ref_ids, side='right') - lo
+        if not counts.any(): return np.zeros(0, dtype=np.int64)
+        starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        return order[np.arange(int(counts.sum())) + starts]
+
+    def rows_for_ids(self, theme_ids):
+        """
+        정수 ref_id / 문서 ID가 섞인 ID 목록을 카탈로그 행 번호로 변환합니다.
+        정수는 ref_id, 문자열은 문서 ID로 찾고, 문서 ID에 없는 숫자 문자열만 ref_id로 다시 찾습니다.
+        그래서 한 테마의 문서 ID가 다른 테마의 ref_id와 같아도 문자열은 문서 ID 쪽 테마로 결정됩니다.
+        """
+        with self.lock:
+            return self._rows_for_ids(theme_ids)
+
+    def _id_index(self):
+        """문서 ID -> 행 번호 (ref_id는 _rows_for_ref_ids의 정렬 배열로 따로 찾음)"""
+        if self._row_index is None:
+            self._row_index = {str(doc_id): row for row, doc_id in enumerate(self.doc_ids)}
+        return self._row_index
+
+    def _rows_for_ids(self, theme_ids):
+        index = self._id_index()
+        rows, ref_ids = set(), []
+        for tid in theme_ids or []:
+            if isinstance(tid, (int, np.integer)) and not isinstance(tid, bool):
+                ref_ids.append(int(tid))
+                continue
+            row = index.get(str(tid))
+            if row is not None: rows.add(row)
+            elif str(tid).isdigit(): ref_ids.append(int(tid))
+        if ref_ids: rows.update(self._rows_for_ref_ids(ref_ids).tolist())
+        return sorted(rows)
+
+    def records_for_ids(self, theme_ids):
+        """문서 ID 목록 -> 같은 순서의 Theme 레코드 리스트 (카탈로그에 없는 ID 자리는 None)"""
+        with self.lock:
+            index = self._id_index()
+            rows = [index.get(str(tid)) for tid in theme_ids]
+            return [self.records[row] if row is not None else None for row in rows]
+
+    def fingerprint(self):
+        """
+        카탈로그 멤버십 + 임베딩 지문. 프로세스가 달라도 같은 카탈로그면 같은 값이 나오므로
+        배치 산출물(사전 계산 Top-K 등)의 catalog_version으로 사용합니다.
+        평점 등 카드 필드는 포함하지 않으므로, 동기화된 평점 변경 한 건으로 전체 Top-K가 무효화되지 않습니다.
+        """
+        with self.lock:
+            if self._fingerprint is None:
+                h = hashlib.sha1()
+                h.update("\n".join(map(str, self.doc_ids)).encode('utf-8'))
+                h.update(self.ref_ids.tobytes())
+                h.update(self.embeddings.tobytes())
+                self._fingerprint = h.hexdigest()[:16]
+            return self._fingerprint
+
+
+class DescriptionStore:
+    """
+    테마 설명 지연 로더. 실제로 응답에 나가는 카드의 설명만 description 필드로
+    프로젝션해 한 번에 가져오고, 문서 ID별로 캐시합니다.
+    catalog가 주어지면 공유 레코드에 쓰는 동안 catalog.lock을 잡고,
+    CatalogSync가 반영한 문서의 캐시 항목은 버려 바뀐 설명을 다시 읽습니다.
+    """
+    def __init__(self, db, catalog=None, max_entries=5000):
+        self.db = db
+        self.catalog = catalog
+        self.max_entries = max_entries
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        if catalog is not None: catalog.add_change_listener(self.invalidate)
+
+    def invalidate(self, doc_ids):
+        with self._lock:
+            self._generation += 1
+            for doc_id in doc_ids: self._cache.pop(doc_id, None)
+
+    def fill(self, cards):
+        """Theme 목록의 빈 desc를 채웁니다. (카탈로그 레코드에 채우면 다음 요청부터는 조회 없음)"""
+        with self._lock:
+            generation = self._generation
+            missing = [c.id for c in cards if not c.desc and c.id not in self._cache]
+        fetched = {}
+        if missing:
+            try:
+                refs = [self.db.collection('themes').document(doc_id) for doc_id in dict.fromkeys(missing)]
+                for snap in self.db.get_all(refs, field_paths=['description']):
+                    data = snap.to_dict() or {}
+                    fetched[snap.id] = (data.get('description') or '')[:150]
+            except Exception:
+                pass
+
+        with self.catalog.lock if self.catalog is not None else contextlib.nullcontext():
+            with self._lock:
+                # 조회 중에 동기화로 무효화됐으면 읽은 값이 이전 설명일 수 있으므로 캐시/레코드에 남기지 않음
+                if generation != self._generation: return cards
+                for doc_id, desc in fetched.items():
+                    if len(self._cache) >= self.max_entries: self._cache.clear()
+                    self._cache[doc_id] = desc
+                for card in cards:
+                    if not card.desc:
+                        card.desc = self._cache.get(card.id, '')
+        return cards
+
+
+class UserIndex:
+    """
+    users 컬렉션 인덱스: 닉네임 -> (정규화 임베딩 또는 None, 플레이한 테마 ID 정렬 배열).
+    CatalogSync가 변경분을 반영하고, 추천기는 Firestore 대신 여기서 읽습니다.
+    """
+    def __init__(self, watermark=None):
+        self.lock = threading.RLock()
+        self.version = int(time.time() * 1000)
+        self.watermark = watermark
+        self._by_nickname = {}
+        self._nickname_of = {}
+
+    def __len__(self):
+        return len(self._by_nickname)
+
+    @staticmethod
+    def _parse(data):
+        try:
+            vector = to_vector_list(data.get('embedding_field'))
+        except Exception:
+            vector = None
+        if vector:
+            vector = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm > 0 else None
+        return vector, decode_played(data)
+
+    @classmethod
+    def load(cls, db, log_func=None):
+        index = cls()
+        docs = db.collection('users').select(['nickname', 'embedding_field', 'updated_at'] + PLAYED_FIELDS).stream()
+        index.apply_changes({doc.id: doc.to_dict() for doc in docs})
+        if log_func: log_func(f"[Users] 유저 {len(index)}명 인덱스 로드")
+        return index
+
+    def apply_changes(self, upserts=None, removals=None):
+        with self.lock:
+            changed = 0
+            for doc_id, data in (upserts or {}).items():
+                nickname = data.get('nickname')
+                if not nickname: continue
+                old_nickname = self._nickname_of.get(doc_id)
+                if old_nickname and old_nickname != nickname: self._by_nickname.pop(old_nickname, None)
+                self._nickname_of[doc_id] = nickname
+                self._by_nickname[nickname] = self._parse(data)
+                updated_at = data.get('updated_at')
+                if updated_at and (self.watermark is None or updated_at > self.watermark): self.watermark = updated_at
+                changed += 1
+            for doc_id in removals or []:
+                nickname = self._nickname_of.pop(doc_id, None)
+                if nickname:
+                    self._by_nickname.pop(nickname, None)
+                    changed += 1
+            if changed: self.version += 1
+            return changed
+
+    def get(self, nickname):
+        """(임베딩, 플레이 ID 정렬 배열) / 미등록 유저는 None"""
+        with self.lock:
+            return self._by_nickname.get(nickname)
+
+    def played_union(self, nicknames):
+        """여러 유저의 플레이 기록 합집합 (모두 등록된 경우만, 아니면 None)"""
+        with self.lock:
+            entries = [self._by_nickname.get(n) for n in nicknames]
+        if any(e is None for e in entries): return None
+        arrays = [played for _, played in entries if len(played)]
+        if not arrays: return EMPTY_PLAYED
+        return arrays[0] if len(arrays) == 1 else np.unique(np.concatenate(arrays))
+
+    def state_digest(self, nicknames):
+        """
+        유저들의 현재 (임베딩, 플레이 기록) 지문 / 미등록 유저가 있으면 None.
+        리스너가 다른 프로세스나 외부 파이프라인의 쓰기도 반영하므로, 결과 캐시 키에 넣으면 별도 무효화 없이 갱신됩니다.
+        """
+        with self.lock:
+            entries = [(n, self._by_nickname.get(n)) for n in sorted(set(nicknames))]
+        if any(e is None for _, e in entries): return None
+        digest = hashlib.sha1()
+        for nickname, (vector, played) in entries:
+            digest.update(nickname.encode('utf-8') + b'\0')
+            if vector is not None: digest.update(vector.tobytes())
+            digest.update(b'\0' + np.ascontiguousarray(played, dtype=np.int64).tobytes())
+        return digest.hexdigest()[:16]
+
+    def set_played(self, nickname, played):
+        """플레이 기록 쓰기 결과를 리스너 반영 전에 바로 인덱스에 적용합니다."""
+        with self.lock:
+            entry = self._by_nickname.get(nickname)
+            if not entry: return
+            self._by_nickname[nickname] = (entry[0], normalize_played(played))
+            self.version += 1
+
+
+@st.cache_resource
+def load_theme_catalog(_db):
+    # CatalogSync가 변경분을 계속 반영하므로 프로세스당 한 번만 전체 로드
+    try:
+        return ThemeCatalog.load(_db)
+    except Exception as e:
+        st.error(f"테마 카탈로그 로드 실패: {e}")
+        return None
+
+
+@st.cache_resource
+def load_user_index(_db):
+    try:
+        return UserIndex.load(_db)
+    except Exception as e:
+        st.error(f"유저 인덱스 로드 실패: {e}")
+        return None
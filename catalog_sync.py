@@ -0,0 +1,136 @@
+import logging
+import threading
+from datetime import datetime, timezone
+
+import streamlit as st
+
+from database import FieldFilter
+from catalog import THEME_VECTOR_FIELDS
+
+logger = logging.getLogger(__name__)
+
+THEME_FIELDS = set(THEME_VECTOR_FIELDS + ['updated_at'])
+
+# ==============================================================================
+# [카탈로그 동기화] themes / users 변경분을 메모리 카탈로그에 실시간 반영
+# ==============================================================================
+
+class CatalogSync:
+    """
+    Firestore on_snapshot 리스너로 themes / users 변경(추가/수정/삭제)을 받아
+    ThemeCatalog / UserIndex에 제자리 반영합니다.
+    리스너를 쓸 수 없으면 updated_at 워터마크 기반 폴링으로 대체하며,
+    폴링 모드에서 삭제는 deleted=True 소프트 삭제 필드로 감지합니다.
+    """
+    def __init__(self, db, catalog, user_index=None, poll_interval=30, use_listeners=True):
+        self.db = db
+        self.catalog = catalog
+        self.user_index = user_index
+        self.poll_interval = poll_interval
+        self.use_listeners = use_listeners
+        self.mode = None
+        self._watches = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def version(self):
+        """단조 증가하는 카탈로그 버전"""
+        return self.catalog.version
+
+    def _targets(self):
+        targets = [('themes', self.catalog)]
+        if self.user_index is not None: targets.append(('users', self.user_index))
+        return targets
+
+    # ------------------------------------------------------------------
+    # 리스너
+    # ------------------------------------------------------------------
+    def _make_callback(self, name, target):
+        def on_snapshot(_snapshot, changes, _read_time):
+            upserts, removals = {}, []
+            for change in changes:
+                if change.type.name == 'REMOVED':
+                    removals.append(change.document.id)
+                else:
+                    data = change.document.to_dict()
+                    if name == 'themes':
+                        # 로드 시와 같은 필드만 사용 (설명은 DescriptionStore 담당)
+                        data = {k: v for k, v in data.items() if k in THEME_FIELDS}
+                    upserts[change.document.id] = data
+            try:
+                changed = target.apply_changes(upserts, removals)
+                if changed: logger.info(f"[Sync] {name} {changed}건 반영 (version={target.version})")
+            except Exception:
+                logger.exception(f"[Sync] {name} 변경 반영 실패")
+        return on_snapshot
+
+    def _start_listeners(self):
+        for name, target in self._targets():
+            self._watches.append(self.db.collection(name).on_snapshot(self._make_callback(name, target)))
+
+    # ------------------------------------------------------------------
+    # 폴링 (updated_at 워터마크)
+    # ------------------------------------------------------------------
+    def poll_once(self):
+        total = 0
+        for name, target in self._targets():
+            watermark = target.watermark or self._started_at
+            query = self.db.collection(name).where(filter=FieldFilter('updated_at', '>', watermark)).order_by('updated_at')
+            if name == 'themes':
+                query = query.select(THEME_VECTOR_FIELDS + ['updated_at', 'deleted'])
+
+            upserts, removals = {}, []
+            for doc in query.stream():
+                data = doc.to_dict()
+                if data.get('deleted'):
+                    removals.append(doc.id)
+                else:
+                    upserts[doc.id] = data
+                if data.get('updated_at') and data['updated_at'] > watermark:
+                    watermark = data['updated_at']
+
+            total += target.apply_changes(upserts, removals)
+            target.watermark = watermark
+        return total
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                changed = self.poll_once()
+                if changed: logger.info(f"[Sync] 폴링으로 {changed}건 반영 (version={self.version})")
+            except Exception:
+                logger.exception("[Sync] 폴링 실패")
+
+    # ------------------------------------------------------------------
+    def start(self):
+        self._started_at = datetime.now(timezone.utc)
+        if self.use_listeners:
+            try:
+                self._start_listeners()
+                self.mode = "listener"
+                return self
+            except Exception as e:
+                logger.warning(f"[Sync] 리스너 시작 실패, 폴링으로 전환: {e}")
+                self._stop_listeners()
+
+        self.mode = "polling"
+        self._thread = threading.Thread(target=self._poll_loop, name="catalog-sync", daemon=True)
+        self._thread.start()
+        return self
+
+    def _stop_listeners(self):
+        for watch in self._watches:
+            try: watch.unsubscribe()
+            except Exception: pass
+        self._watches = []
+
+    def stop(self):
+        self._stop.set()
+        self._stop_listeners()
+
+
+@st.cache_resource
+def load_catalog_sync(_db, _catalog, _user_index=None):
+    if _catalog is None: return None
+    return CatalogSync(_db, _catalog, _user_index).start()
@@ -7,4 +7,50 @@ LOCAL_CACHE_DIR = "./model_cache"
 
 # API Keys (Streamlit Secrets에서 로드, 없으면 None)
 GROQ_API_KEY = st.secrets.get("GROQ_API_KEY", None)
-TAVILY_API_KEY = st.secrets.get("TAVILY_API_KEY", None)
\ No newline at end of file
+TAVILY_API_KEY = st.secrets.get("TAVILY_API_KEY", None)
+
+# 개인화 Top-K 사전 계산 결과 (precompute.py)
+TOPK_STORE_BACKEND = "local"  # "local" | "firestore"
+TOPK_STORE_PATH = "./precompute_cache/user_topk.json"
+TOPK_COLLECTION = "user_topk"
+
+# 임베딩 재생성 배치 (reembed.py): 진행 체크포인트 / 유저 임베딩 입력 리뷰 필드
+REEMBED_CHECKPOINT_PATH = "./precompute_cache/reembed_checkpoint.json"
+USER_REVIEW_FIELD = "reviews"
+
+# 추천 워커 (worker.py) - app.py는 이 주소로 generate_reply를 위임하고, 연결 불가 시 인프로세스로 처리
+WORKER_HOST = "127.0.0.1"
+WORKER_PORT = 8765
+WORKER_URL = st.secrets.get("WORKER_URL", f"http://{WORKER_HOST}:{WORKER_PORT}")
+WORKER_MAX_CONCURRENCY = 4
+WORKER_MAX_QUEUE = 16
+WORKER_REQUEST_TIMEOUT = 60
+
+# 추천 랭킹 모드: "split" = 조건/맞춤 검색을 각각 수행, "hybrid" = 카탈로그 1회 스캔 + RRF 통합 랭킹 추가
+# hybrid로 바꾸면 동작이 달라집니다:
+#   - 조건 추천 후보가 평점 상위 200개가 아니라 카탈로그 전체에서 나옴
+#   - 맞춤 추천이 사전 계산 Top-K(precompute.py)를 거치지 않고 카탈로그에서 직접 계산됨
+RANKING_MODE = "split"
+
+# 로컬 의도 분류기: 프로토타입 유사도가 임계값 이상이고 2위와 차이가 충분할 때만 LLM 생략
+INTENT_CONFIDENCE_THRESHOLD = 0.55
+INTENT_MARGIN = 0.05
+
+# 플레이 기록 호환: True면 played_packed와 함께 기존 played 배열에도 추가/삭제를 적용 (배열을 읽는 외부 파이프라인용)
+# 배열을 읽는 곳이 없어지면 False로 바꾼 뒤 `python play_history.py --migrate --drop-legacy` 실행
+PLAYED_LEGACY_WRITES = True
+
+# Firestore 'in' 쿼리 한 번에 넣을 수 있는 값 개수 (그룹 인원이 더 많으면 나눠서 조회)
+FIRESTORE_IN_LIMIT = 10
+
+# 그룹 맞춤 추천 점수: "mean" = 평균 취향 벡터, "least_misery" = 가장 덜 좋아할 멤버 기준, "avg_sim" = 멤버별 유사도 평균
+GROUP_SCORING_MODE = "mean"
+
+# LLM 스케줄러: Groq 할당량(분당 요청/토큰)에 맞춘 토큰 버킷 + 우선순위 대기열
+# 대기 시간이 기한을 넘길 것 같으면 LLM 없이 로컬 의도 분석으로 처리
+GROQ_RPM = 30
+GROQ_TPM = 12000
+LLM_BURST = 5
+LLM_MAX_QUEUE = 64
+LLM_QUEUE_DEADLINE = 3.0          # 추천 요청 최대 대기(초)
+LLM_PLAY_RECORD_DEADLINE = 10.0   # 플레이 기록 요청 최대 대기(초)
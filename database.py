@@ -40,6 +40,15 @@ if DistanceMeasure is None:
     class DistanceMeasure:
         COSINE = "COSINE"
 
+def run_transaction(db, func):
+    """
+    func(transaction)을 @firestore.transactional 규약(충돌 시 재시도, 성공 시 커밋)으로 실행하고 반환값을 돌려줍니다.
+    클라이언트가 run_transaction을 직접 제공하면(loadtest의 메모리 Firestore 등) 그쪽을 사용합니다.
+    """
+    runner = getattr(db, 'run_transaction', None)
+    if callable(runner): return runner(func)
+    return firestore.transactional(func)(db.transaction())
+
 # ==============================================================================
 # [Firebase 초기화]
 # ==============================================================================
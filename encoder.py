@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+import numpy as np
+
+# ==============================================================================
+# [마이크로 배치 인코더] 동시에 들어온 encode 요청을 한 번의 배치로 처리
+# ==============================================================================
+
+class BatchingEncoder:
+    """
+    SentenceTransformer 앞단의 요청 큐.
+    여러 세션이 동시에 encode를 호출하면 max_batch_size개가 모이거나
+    첫 요청 이후 max_wait_ms가 지나는 순간 한 번의 model.encode로 처리하고,
+    각 요청에는 Future로 결과 벡터를 돌려줍니다.
+    """
+    def __init__(self, model, max_batch_size=32, max_wait_ms=5, metrics_window=1000):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        # 메트릭 (최근 metrics_window개 기준)
+        self._metrics_lock = threading.Lock()
+        self._batch_sizes = deque(maxlen=metrics_window)
+        self._queue_delays = deque(maxlen=metrics_window)
+        self.total_batches = 0
+        self.total_items = 0
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive(): return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive(): return
+            self._thread = threading.Thread(target=self._loop, name="batching-encoder", daemon=True)
+            self._thread.start()
+
+    def submit(self, text):
+        future = Future()
+        self._ensure_started()
+        self._queue.put((time.monotonic(), text, future))
+        return future
+
+    def encode(self, text, timeout=None):
+        """단일 문자열 -> 1차원 벡터 (model.encode(str)와 동일한 형태)"""
+        return self.submit(text).result(timeout=timeout)
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][0] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.monotonic()
+            texts = [text for _, text, _ in batch]
+            try:
+                vectors = np.asarray(self.model.encode(texts, batch_size=len(texts)))
+                for (_, _, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+
+            with self._metrics_lock:
+                self.total_batches += 1
+                self.total_items += len(batch)
+                self._batch_sizes.append(len(batch))
+                self._queue_delays.extend(started - submitted for submitted, _, _ in batch)
+
+    def stats(self):
+        with self._metrics_lock:
+            sizes = np.array(self._batch_sizes) if self._batch_sizes else np.zeros(1)
+            delays = np.array(self._queue_delays) * 1000 if self._queue_delays else np.zeros(1)
+            return {
+                "batches": self.total_batches,
+                "items": self.total_items,
+                "queued": self._queue.qsize(),
+                "batch_size_avg": round(float(sizes.mean()), 2),
+                "batch_size_max": int(sizes.max()),
+                "queue_delay_ms_p50": round(float(np.percentile(delays, 50)), 2),
+                "queue_delay_ms_p95": round(float(np.percentile(delays, 95)), 2),
+            }
@@ -0,0 +1,221 @@
+import re
+import threading
+
+import numpy as np
+
+from utils import SORT_KEYWORDS
+
+# ==============================================================================
+# [로컬 의도 분류기] 임베딩 프로토타입 + 정규식 (LLM 호출 전 1단계)
+# ==============================================================================
+
+# 액션별 대표 문장. 쿼리 임베딩과 가장 가까운 프로토타입의 액션을 고릅니다.
+ACTION_PROTOTYPES = {
+    "recommend": [
+        "강남에서 공포 테마 추천해줘",
+        "홍대에서 활동성 많은거",
+        "방탈출 추천해줘",
+        "안무서운 테마 알려줘",
+        "스토리 좋은 방탈출 뭐 있어",
+        "4명이서 할만한 테마 추천",
+        "평점 4점 이상인 테마",
+        "초보가 하기 좋은 쉬운 테마",
+        "인테리어 예쁜 방 추천해줘",
+        "문제방 추천",
+    ],
+    "another_recommend": [
+        "다른거 추천해줘",
+        "다른 테마는?",
+        "또 다른거 없어?",
+        "더 보여줘",
+        "이거 말고 다른거",
+        "다른 거 더 추천해줘",
+    ],
+    "played_check": [
+        "강남 링 했어",
+        "홍대에 있는 삐릿뽀 했어",
+        "건대 테마 플레이했어",
+        "그 테마 해봤어",
+    ],
+    "not_played_check": [
+        "홍대에 있는 삐릿뽀 안했어",
+        "링 안 했어 기록 취소해줘",
+        "플레이 기록 삭제해줘",
+    ],
+    "played_check_inquiry": [
+        "플레이한 테마 어떻게 기록해?",
+        "기록하는 방법 알려줘",
+        "했던 테마 등록은 어떻게 해",
+    ],
+}
+
+# 플레이 기록 액션은 테마명/지역(items) 추출이 필요하므로 항상 LLM으로 넘깁니다.
+LLM_ONLY_ACTIONS = {"played_check", "not_played_check"}
+
+# "[지역] [테마명] (안)했어" 형태의 플레이 기록 요청
+PLAY_RECORD_PATTERN = re.compile(r"^\s*(.+?)\s*(안\s?했어|안\s?해봤어|플레이\s?했어|했어|해봤어)\s*[.!~]*\s*$")
+PLACE_SUFFIX_PATTERN = re.compile(r"(에\s*있는|에서|에)$")
+# 모델 없이 판단할 때 쓰는 "다른거" 요청 표현
+ANOTHER_PATTERN = re.compile(r"(다른\s*(거|것|테마)|더\s*보여|말고)")
+
+# 다른 유저를 언급하는 것으로 보이는 표현 -> mentioned_users 추출을 위해 LLM으로 넘김
+MENTION_PATTERN = re.compile(r"(같이|함께|님[이과와랑]?\s|이랑|하고\s)")
+
+# 앞에 숫자/소수점이 붙은 경우("10점"의 "0점")는 평점으로 보지 않음
+MIN_RATING_PATTERN = re.compile(r"(?<![\d.])([0-5](?:\.\d+)?)\s*점?\s*(?:이상|넘|초과|부터|보다)|(?<![\d.])([0-5](?:\.\d+)?)\s*점")
+PEOPLE_PATTERN = re.compile(r"(\d{1,2})\s*(?:명|인)")
+PEOPLE_WORDS = [
+    ("혼자", 1), ("둘이", 2), ("두명", 2), ("두 명", 2), ("셋이", 3), ("세명", 3), ("세 명", 3),
+    ("넷이", 4), ("네명", 4), ("네 명", 4), ("다섯", 5), ("여섯", 6),
+]
+
+# 정렬/표시에 쓰이는 키워드 어휘 (utils.SORT_RULES에서 생성해 LLM 경로와 같은 정렬이 되도록)
+KEYWORD_VOCAB = SORT_KEYWORDS
+
+
+def extract_min_rating(text):
+    match = MIN_RATING_PATTERN.search(text)
+    if not match: return None
+    return float(match.group(1) or match.group(2))
+
+
+def extract_people_count(text):
+    match = PEOPLE_PATTERN.search(text)
+    if match: return int(match.group(1))
+    for word, count in PEOPLE_WORDS:
+        if word in text: return count
+    return None
+
+
+def is_play_record(text):
+    return bool(text and PLAY_RECORD_PATTERN.match(text))
+
+
+def extract_play_items(text, known_locations=()):
+    """
+    "강남 링 했어" / "홍대에 있는 삐릿뽀 안했어" -> (액션, [{"theme", "location"}])
+    형태가 맞지 않으면 None. LLM을 쓸 수 없을 때의 대체 추출입니다.
+    """
+    match = PLAY_RECORD_PATTERN.match(text or "")
+    if not match: return None
+    action = "not_played_check" if match.group(2).startswith("안") else "played_check"
+
+    words = match.group(1).split()
+    location = ""
+    if len(words) >= 2:
+        first = PLACE_SUFFIX_PATTERN.sub("", words[0])
+        if first in known_locations:
+            location = first
+            words = words[1:]
+            if words and words[0] == "있는": words = words[1:]
+    theme = " ".join(words).strip()
+    if not theme: return None
+    return action, [{"theme": theme, "location": location}]
+
+
+def extract_keywords(text):
+    found = []
+    for word in KEYWORD_VOCAB:
+        # "안무서운"에 포함된 "무서운"처럼 이미 잡힌 키워드의 일부는 건너뜀
+        if word in text and not any(word in f for f in found):
+            found.append(word)
+    return found
+
+
+class LocalIntentClassifier:
+    """
+    이미 로드된 sentence-transformer로 쿼리를 임베딩하고 액션별 프로토타입과 비교합니다.
+    1위 유사도가 threshold 이상이고 2위 액션과 margin 이상 차이 날 때만 확정하며,
+    그 외에는 None을 반환해 LLM 경로(analyze_user_intent)로 넘깁니다.
+    """
+    def __init__(self, model, encoder=None, threshold=0.55, margin=0.05):
+        self.model = model
+        self.encoder = encoder
+        self.threshold = threshold
+        self.margin = margin
+        self._labels = None
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def _prototypes(self):
+        if self._matrix is None:
+            with self._lock:
+                if self._matrix is None:
+                    labels, phrases = [], []
+                    for action, examples in ACTION_PROTOTYPES.items():
+                        labels.extend([action] * len(examples))
+                        phrases.extend(examples)
+                    matrix = np.asarray(self.model.encode(phrases), dtype=np.float32)
+                    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+                    self._labels = np.array(labels)
+                    self._matrix = matrix
+        return self._labels, self._matrix
+
+    def classify(self, query):
+        """(액션, 1위 유사도, 2위 액션과의 차이)"""
+        labels, matrix = self._prototypes()
+        vector = np.asarray((self.encoder or self.model).encode(query), dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        sims = matrix @ vector
+
+        best = {}
+        for label, sim in zip(labels.tolist(), sims.tolist()):
+            if sim > best.get(label, -1.0): best[label] = sim
+        ranked = sorted(best.items(), key=lambda x: x[1], reverse=True)
+        top_action, top_sim = ranked[0]
+        second_sim = ranked[1][1] if len(ranked) > 1 else -1.0
+        return top_action, top_sim, top_sim - second_sim
+
+    def fallback(self, query, known_locations=()):
+        """
+        LLM을 쓸 수 없을 때(할당량 소진 등) 임계값 없이 로컬에서 최선의 추정을 돌려줍니다.
+        플레이 기록은 정규식으로 테마/지역을 뽑고, 나머지는 가장 가까운 프로토타입 액션을 씁니다.
+        """
+        if not query: return None
+        play = extract_play_items(query, known_locations)
+        if play:
+            action, items = play
+            return {"action": action, "keywords": [], "min_rating": None, "people_count": None,
+                    "mentioned_users": [], "items": items, "confidence": None, "source": "local_fallback"}
+
+        action = "another_recommend" if ANOTHER_PATTERN.search(query) else "recommend"
+        confidence = None
+        if self.model:
+            try:
+                action, confidence, _ = self.classify(query)
+                confidence = round(confidence, 3)
+            except Exception:
+                pass
+            if action in LLM_ONLY_ACTIONS: action = "recommend"
+
+        return {
+            "action": action,
+            "keywords": extract_keywords(query),
+            "min_rating": extract_min_rating(query),
+            "people_count": extract_people_count(query),
+            "mentioned_users": [],
+            "items": [],
+            "confidence": confidence,
+            "source": "local_fallback",
+        }
+
+    def analyze(self, query):
+        """확신할 수 있으면 analyze_user_intent와 같은 형태의 딕셔너리, 아니면 None"""
+        if not self.model or not query or MENTION_PATTERN.search(query): return None
+        try:
+            action, confidence, margin = self.classify(query)
+        except Exception:
+            return None
+        if action in LLM_ONLY_ACTIONS or confidence < self.threshold or margin < self.margin:
+            return None
+
+        return {
+            "action": action,
+            "keywords": extract_keywords(query),
+            "min_rating": extract_min_rating(query),
+            "people_count": extract_people_count(query),
+            "mentioned_users": [],
+            "items": [],
+            "confidence": round(confidence, 3),
+            "source": "local",
+        }
@@ -0,0 +1,158 @@
+import heapq
+import itertools
+import threading
+import time
+
+import streamlit as st
+
+from config import GROQ_RPM, GROQ_TPM, LLM_BURST, LLM_MAX_QUEUE
+
+# ==============================================================================
+# [LLM 스케줄러] 프로세스 전역 토큰 버킷 + 우선순위 대기열 + 대기 기한
+# ==============================================================================
+
+# 숫자가 작을수록 먼저 처리
+PRIORITY_PLAY_RECORD = 0
+PRIORITY_RECOMMEND = 1
+
+
+class LLMBudgetExceeded(Exception):
+    """할당량 안에서 기한 내에 호출할 수 없음 -> 호출자는 로컬 경로로 처리"""
+    pass
+
+
+def estimate_tokens(prompt, completion_reserve=150):
+    """프롬프트 + 응답 토큰 대략치 (영문 ~4자, 한글 ~1자당 1토큰 사이를 3자로 근사)"""
+    return len(prompt) // 3 + completion_reserve
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec, capacity):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """amount만큼 쌓일 때까지 남은 시간 (refill 후 호출)"""
+        deficit = amount - self.tokens
+        return 0.0 if deficit <= 0 else deficit / self.rate
+
+
+class _Ticket:
+    __slots__ = ('priority', 'seq', 'deadline', 'cost', 'cancelled')
+
+    def __init__(self, priority, seq, deadline, cost):
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.cost = cost
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """
+    모든 세션의 LLM 호출을 한 줄로 세워 분당 요청 수(rpm) / 토큰 수(tpm) 안에서만 내보냅니다.
+    - 우선순위가 높은(숫자가 작은) 요청이 먼저 나가고, 같은 우선순위는 도착 순서
+    - 대기열 위치로 예상 대기 시간을 계산해 기한을 넘길 것 같으면 바로 LLMBudgetExceeded
+    - 429를 받으면 retry_after 동안 전체 발송을 멈춰 재시도 폭주를 막음
+    """
+    def __init__(self, rpm=GROQ_RPM, tpm=GROQ_TPM, burst=LLM_BURST, max_queue=LLM_MAX_QUEUE):
+        self.requests = TokenBucket(rpm / 60.0, burst)
+        self.tokens = TokenBucket(tpm / 60.0, max(tpm / 60.0 * burst, 1))
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self.granted = 0
+        self.rejected = 0
+        self.expired = 0
+        self.rate_limited = 0
+
+    def _wait_for(self, ticket, now):
+        """ticket이 나가기까지의 예상 대기 (앞선 요청 비용까지 포함)"""
+        ahead = [t for t in self._heap if not t.cancelled and t < ticket]
+        n_requests = len(ahead) + 1
+        n_tokens = sum(t.cost for t in ahead) + ticket.cost
+        wait = max(self.requests.wait_time(n_requests), self.tokens.wait_time(n_tokens))
+        return max(wait, self._paused_until - now)
+
+    def _pop_cancelled(self):
+        while self._heap and self._heap[0].cancelled:
+            heapq.heappop(self._heap)
+
+    def acquire(self, cost, priority=PRIORITY_RECOMMEND, max_wait=3.0):
+        """할당량을 얻을 때까지 대기. 기한 안에 못 얻으면 LLMBudgetExceeded"""
+        with self._cond:
+            now = time.monotonic()
+            ticket = _Ticket(priority, next(self._seq), now + max_wait, min(cost, self.tokens.capacity))
+            self.requests.refill(now)
+            self.tokens.refill(now)
+
+            live = sum(1 for t in self._heap if not t.cancelled)
+            if live >= self.max_queue or self._wait_for(ticket, now) > max_wait:
+                self.rejected += 1
+                raise LLMBudgetExceeded("LLM 할당량 초과 (예상 대기 시간이 기한을 넘김)")
+            heapq.heappush(self._heap, ticket)
+
+            while True:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                self._pop_cancelled()
+
+                if self._heap[0] is ticket and now >= self._paused_until:
+                    wait = max(self.requests.wait_time(1), self.tokens.wait_time(ticket.cost))
+                    if wait == 0:
+                        heapq.heappop(self._heap)
+                        self.requests.tokens -= 1
+                        self.tokens.tokens -= ticket.cost
+                        self.granted += 1
+                        self._cond.notify_all()
+                        return
+                else:
+                    wait = max(self._paused_until - now, 0.01) if self._heap[0] is ticket else ticket.deadline - now
+
+                if now >= ticket.deadline:
+                    ticket.cancelled = True
+                    self._pop_cancelled()
+                    self.expired += 1
+                    self._cond.notify_all()
+                    raise LLMBudgetExceeded("LLM 대기 기한 초과")
+                self._cond.wait(min(wait, ticket.deadline - now))
+
+    def report_rate_limited(self, retry_after=None):
+        """서버가 429를 돌려주면 버킷을 비우고 retry_after 동안 발송 중지"""
+        with self._cond:
+            now = time.monotonic()
+            self.rate_limited += 1
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            self.requests.tokens = min(self.requests.tokens, 0)
+            self.tokens.tokens = min(self.tokens.tokens, 0)
+            self._paused_until = max(self._paused_until, now + (retry_after or 1.0 / self.requests.rate))
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": sum(1 for t in self._heap if not t.cancelled),
+                "granted": self.granted,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "rate_limited": self.rate_limited,
+            }
+
+
+@st.cache_resource
+def load_llm_scheduler():
+    """프로세스 전역 스케줄러 (모든 세션/엔진이 같은 할당량을 공유)"""
+    return LLMScheduler()
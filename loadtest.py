@@ -0,0 +1,596 @@
+"""
+동시 채팅 세션 부하 테스트.
+
+    python loadtest.py --levels 1,4,16,32 --duration 20 --llm-latency 0.4 --llm-failure 0.05
+
+실제 Groq / Firestore 대신 지연·실패율을 조절할 수 있는 스텁 LLM과
+메모리 Firestore를 사용해 EscapeBotEngine.generate_reply를 여러 세션에서 동시에 호출하고,
+동시성 단계별 처리량 / p50·p95·p99 지연 / 에러율 / 저하율을 출력합니다.
+에러율은 예외로 끝난 요청, 저하율은 LLM 대신 로컬 의도 분석으로 답한 요청(429 / 스케줄러 기한 초과)의 비율입니다.
+실행 중에는 CatalogSync가 메모리 Firestore의 on_snapshot(--sync polling이면 폴링)으로 플레이 기록 쓰기를 반영합니다.
+"""
+import argparse
+import contextlib
+import copy
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.watch import ChangeType
+from groq import RateLimitError
+
+from config import GROUP_SCORING_MODE, RANKING_MODE
+from bot_engine import EscapeBotEngine, ALL_LOCATIONS
+from catalog import ThemeCatalog, UserIndex
+from catalog_sync import CatalogSync
+from recommenders import RuleBasedRecommender, VectorRecommender, HybridRecommender
+from llm_scheduler import LLMScheduler
+from play_history import encode_played
+
+# ==============================================================================
+# [메모리 Firestore] 이 프로젝트가 쓰는 쿼리 API만 구현
+# ==============================================================================
+class _Snapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class _DocumentRef:
+    def __init__(self, db, collection, doc_id):
+        self.db = db
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self, field_paths=None, transaction=None):
+        with self.db.lock:
+            data = self.db.data.get(self.collection, {}).get(self.id)
+            if data is not None and field_paths:
+                data = {k: v for k, v in data.items() if k in field_paths}
+            return _Snapshot(self, copy.deepcopy(data))
+
+    def set(self, data, merge=False):
+        with self.db.writing():
+            docs = self.db.data.setdefault(self.collection, {})
+            current = docs.get(self.id, {}) if merge else {}
+            docs[self.id] = self.db.apply(dict(current), copy.deepcopy(data))
+            self.db.changed(self.collection, self.id)
+
+    def update(self, data):
+        with self.db.writing():
+            docs = self.db.data[self.collection]
+            docs[self.id] = self.db.apply(docs[self.id], data)
+            self.db.changed(self.collection, self.id)
+
+    def delete(self):
+        with self.db.writing():
+            self.db.data.get(self.collection, {}).pop(self.id, None)
+            self.db.changed(self.collection, self.id)
+
+
+class _Query:
+    def __init__(self, db, collection, filters=(), order=None, limit_count=None, fields=None, after_id=None):
+        self.db = db
+        self.collection = collection
+        self.filters = list(filters)
+        self.order = order
+        self.limit_count = limit_count
+        self.fields = fields
+        self.after_id = after_id
+
+    def _copy(self, **changes):
+        q = _Query(self.db, self.collection, self.filters, self.order, self.limit_count, self.fields, self.after_id)
+        for key, value in changes.items(): setattr(q, key, value)
+        return q
+
+    def where(self, filter=None):
+        return self._copy(filters=self.filters + [filter])
+
+    def order_by(self, field, direction=None):
+        return self._copy(order=(field, direction))
+
+    def start_after(self, cursor):
+        """order_by('__name__') 커서만 지원: {'__name__': 문서 참조}"""
+        return self._copy(after_id=cursor['__name__'].id)
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def document(self, doc_id):
+        return _DocumentRef(self.db, self.collection, doc_id)
+
+    def on_snapshot(self, callback):
+        """컬렉션 전체 리스너만 지원 (필터/정렬은 무시)"""
+        return self.db.watch(self.collection, callback)
+
+    def stream(self):
+        self.db.simulate_latency()
+        return iter(self.fetch())
+
+    def fetch(self):
+        """지연 없이 현재 결과 스냅샷 리스트"""
+        with self.db.lock:
+            items = list(self.db.data.get(self.collection, {}).items())
+            for f in self.filters:
+                field, op, value = f.field_path, f.op_string, f.value
+                if op == "==": items = [(i, d) for i, d in items if d.get(field) == value]
+                elif op == "in": items = [(i, d) for i, d in items if d.get(field) in value]
+                elif op == ">": items = [(i, d) for i, d in items if d.get(field) is not None and d.get(field) > value]
+                else: raise NotImplementedError(op)
+            if self.order:
+                field, direction = self.order
+                key = (lambda x: x[0]) if field == '__name__' else (lambda x: x[1].get(field) or 0)
+                items.sort(key=key, reverse=(direction == "DESCENDING"))
+            if self.after_id is not None: items = [(i, d) for i, d in items if i > self.after_id]
+            if self.limit_count: items = items[:self.limit_count]
+            snaps = []
+            for doc_id, data in items:
+                if self.fields is not None: data = {k: v for k, v in data.items() if k in self.fields}
+                snaps.append(_Snapshot(_DocumentRef(self.db, self.collection, doc_id), copy.deepcopy(data)))
+        return snaps
+
+
+class _WriteBatch:
+    def __init__(self, db):
+        self.db = db
+        self._ops = []
+
+    def set(self, ref, data, merge=False): self._ops.append(lambda: ref.set(data, merge=merge))
+    def update(self, ref, data): self._ops.append(lambda: ref.update(data))
+    def delete(self, ref): self._ops.append(ref.delete)
+
+    def commit(self):
+        with self.db.writing():
+            for op in self._ops: op()
+        self._ops = []
+
+
+class _Transaction(_WriteBatch):
+    """트랜잭션 대역: 읽기는 ref.get(transaction=...)로 바로, 쓰기는 모았다가 커밋 시 한 번에 반영"""
+    pass
+
+
+class _DocumentChange:
+    def __init__(self, change_type, document):
+        self.type = change_type
+        self.document = document
+
+
+class _Watch:
+    def __init__(self, db, collection, callback):
+        self.db = db
+        self.collection = collection
+        self.callback = callback
+
+    def unsubscribe(self):
+        self.db.unwatch(self)
+
+
+class InMemoryFirestore:
+    """
+    Firestore 클라이언트 대역. read_latency(초)만큼 쿼리마다 지연을 줍니다.
+    on_snapshot 리스너는 동기식입니다: 등록 즉시 현재 문서 전체를 ADDED로 한 번 보내고,
+    이후 쓰기마다 가장 바깥 쓰기 구간(트랜잭션/배치 포함)이 끝난 뒤 잠금 밖에서 변경분을 보냅니다.
+    """
+    def __init__(self, read_latency=0.0):
+        self.data = {}
+        self.lock = threading.RLock()
+        self.read_latency = read_latency
+        self._watches = []
+        self._pending = []
+        self._write_depth = 0
+        # 리스너 호출 순서를 쓰기 순서와 맞추기 위한 잠금 (콜백은 DB 잠금 밖에서 실행)
+        self._dispatch_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 리스너
+    # ------------------------------------------------------------------
+    @contextlib.contextmanager
+    def writing(self):
+        """쓰기 구간. 중첩되면 가장 바깥 구간이 끝날 때 모인 변경을 한 번에 전달합니다."""
+        pending = []
+        try:
+            with self.lock:
+                self._write_depth += 1
+                try:
+                    yield
+                finally:
+                    self._write_depth -= 1
+                    if self._write_depth == 0: pending, self._pending = self._pending, []
+        finally:
+            if pending: self._dispatch(pending)
+
+    def changed(self, collection, doc_id):
+        if any(w.collection == collection for w in self._watches): self._pending.append((collection, doc_id))
+
+    def watch(self, collection, callback):
+        watch = _Watch(self, collection, callback)
+        with self._dispatch_lock:
+            with self.lock:
+                self._watches.append(watch)
+                docs = _Query(self, collection).fetch()
+            changes = [_DocumentChange(ChangeType.ADDED, doc) for doc in docs]
+            callback(docs, changes, datetime.now(timezone.utc))
+        return watch
+
+    def unwatch(self, watch):
+        with self.lock:
+            if watch in self._watches: self._watches.remove(watch)
+
+    def _dispatch(self, pending):
+        with self._dispatch_lock:
+            keys = list(dict.fromkeys(pending))
+            for watch in list(self._watches):
+                # 쓰기 시점이 아니라 현재 상태를 보내므로 스레드 간 전달 순서가 바뀌어도 최종 상태는 같음
+                snaps = [_DocumentRef(self, c, doc_id).get() for c, doc_id in keys if c == watch.collection]
+                if not snaps: continue
+                changes = [_DocumentChange(ChangeType.MODIFIED if s.exists else ChangeType.REMOVED, s) for s in snaps]
+                watch.callback([s for s in snaps if s.exists], changes, datetime.now(timezone.utc))
+
+    def simulate_latency(self):
+        if self.read_latency: time.sleep(self.read_latency)
+
+    def apply(self, current, data):
+        """ArrayUnion / ArrayRemove / SERVER_TIMESTAMP / DELETE_FIELD 처리"""
+        for key, value in data.items():
+            if isinstance(value, transforms.ArrayUnion):
+                existing = list(current.get(key, []))
+                current[key] = existing + [v for v in value.values if v not in existing]
+            elif isinstance(value, transforms.ArrayRemove):
+                current[key] = [v for v in current.get(key, []) if v not in value.values]
+            elif value is transforms.SERVER_TIMESTAMP:
+                current[key] = datetime.now(timezone.utc)
+            elif value is transforms.DELETE_FIELD:
+                current.pop(key, None)
+            else:
+                current[key] = value
+        return current
+
+    def collection(self, name):
+        return _Query(self, name)
+
+    def batch(self):
+        return _WriteBatch(self)
+
+    def transaction(self):
+        return _Transaction(self)
+
+    def run_transaction(self, func):
+        """
+        @firestore.transactional 규약 대역 (database.run_transaction이 사용).
+        DB 잠금을 잡은 채 func(transaction)을 실행해 성공하면 커밋, 예외면 모은 쓰기를 버립니다.
+        잠금으로 직렬화되므로 충돌 재시도는 필요 없습니다.
+        """
+        with self.writing():
+            transaction = self.transaction()
+            result = func(transaction)
+            transaction.commit()
+            return result
+
+    def get_all(self, refs, field_paths=None):
+        self.simulate_latency()
+        return [ref.get(field_paths) for ref in refs]
+
+
+# ==============================================================================
+# [스텁 LLM / 모델]
+# ==============================================================================
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+
+class _Choice:
+    def __init__(self, content):
+        self.message = _Message(content)
+
+
+class _Completion:
+    def __init__(self, content):
+        self.choices = [_Choice(content)]
+
+
+class StubGroq:
+    """
+    groq.Groq 대역. 지연(latency ± jitter)과 실패율(failure_rate)을 조절할 수 있고,
+    쿼리 문자열에서 간단한 규칙으로 의도 JSON을 만들어 돌려줍니다.
+    실패는 SDK와 같은 RateLimitError(429, retry-after 헤더)로 던져 스케줄러의 백오프 경로를 태웁니다.
+    """
+    def __init__(self, latency=0.3, jitter=0.1, failure_rate=0.0, seed=None, retry_after=1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.chat = self
+        self.completions = self
+
+    @staticmethod
+    def _intent(query):
+        if "다른" in query:
+            action = "another_recommend"
+        elif "안했어" in query or "안 했어" in query:
+            action = "not_played_check"
+        elif "했어" in query:
+            action = "played_check"
+        else:
+            action = "recommend"
+
+        items = []
+        match = re.search(r"(\S+)\s+(\S+)\s+(?:안\s?)?했어", query)
+        if action in ("played_check", "not_played_check") and match:
+            items.append({"location": match.group(1), "theme": match.group(2)})
+
+        rating = re.search(r"([0-5](?:\.\d)?)점", query)
+        people = re.search(r"(\d+)명", query)
+        mentioned = re.findall(r"(\S+)이랑", query)
+        return {
+            "action": action,
+            "keywords": [w for w in ("공포", "스토리", "활동", "문제방", "안무서운") if w in query],
+            "min_rating": float(rating.group(1)) if rating else None,
+            "people_count": int(people.group(1)) if people else None,
+            "mentioned_users": mentioned,
+            "items": items,
+        }
+
+    def create(self, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.failure_rate
+            delay = max(0.0, self._rng.gauss(self.latency, self.jitter))
+        time.sleep(delay)
+        if fail:
+            with self._lock: self.failures += 1
+            request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+            response = httpx.Response(429, headers={"retry-after": str(self.retry_after)}, request=request)
+            raise RateLimitError("429 Too Many Requests (stub)", response=response, body=None)
+        prompt = messages[-1]["content"]
+        match = re.search(r'Query: "(.*)"', prompt)
+        return _Completion(json.dumps(self._intent(match.group(1) if match else prompt), ensure_ascii=False))
+
+
+class StubEmbedModel:
+    """문자열 해시로 고정된 난수 벡터를 돌려주는 SentenceTransformer 대역"""
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _one(self, text):
+        seed = int.from_bytes(uuid.uuid5(uuid.NAMESPACE_OID, text).bytes[:4], "little")
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+
+    def encode(self, sentences, **kwargs):
+        if isinstance(sentences, str): return self._one(sentences)
+        return np.stack([self._one(s) for s in sentences])
+
+
+# ==============================================================================
+# [데이터 / 시나리오]
+# ==============================================================================
+KEYWORDS = ["공포", "안무서운", "스토리", "활동성 많은", "문제방", "인테리어 예쁜", "초보"]
+
+
+def seed_database(db, n_themes=2000, n_users=300, dim=384, seed=0, max_played=200):
+    rng = np.random.default_rng(seed)
+    locations = sorted(ALL_LOCATIONS)
+    themes, users = {}, {}
+    for i in range(n_themes):
+        # 운영 데이터처럼 문서 ID = str(ref_id) (카드 ID로 넘어온 제외 목록을 ref_id와 비교하는 경로가 있음)
+        themes[str(10000 + i)] = {
+            'ref_id': 10000 + i,
+            'title': f"테마{i}",
+            'store_name': f"매장{i % 97}",
+            'location': locations[i % len(locations)],
+            'description': f"테마{i} 설명 " * 20,
+            'satisfyTotalRating': round(float(rng.uniform(2.5, 5.0)), 2),
+            'fearTotalRating': float(rng.uniform(0, 5)),
+            'difficultyTotalRating': float(rng.uniform(0, 5)),
+            'activityTotalRating': float(rng.uniform(0, 5)),
+            'problemTotalRating': float(rng.uniform(0, 5)),
+            'storyTotalRating': float(rng.uniform(0, 5)),
+            'interiorTotalRating': float(rng.uniform(0, 5)),
+            'actTotalRating': float(rng.uniform(0, 5)),
+            'average_person_count': int(rng.integers(2, 6)),
+            'embedding_field': rng.standard_normal(dim).astype(np.float32).tolist(),
+        }
+    for u in range(n_users):
+        played = rng.choice(n_themes, size=int(rng.integers(0, min(max_played, n_themes) + 1)), replace=False)
+        played = [10000 + int(p) for p in played]
+        users[f"u{u}"] = {
+            'nickname': f"유저{u}",
+            'embedding_field': rng.standard_normal(dim).astype(np.float32).tolist(),
+        }
+        # 절반은 기존 played 배열, 절반은 packed 형식
+        if u % 2: users[f"u{u}"]['played'] = played
+        else: users[f"u{u}"]['played_packed'] = encode_played(played)
+    db.data['themes'] = themes
+    db.data['users'] = users
+    return locations
+
+
+class ChatSession:
+    """app.py의 세션 상태(shown_ids, last_filters)를 흉내 내는 가상 사용자"""
+    def __init__(self, engine, locations, n_users, rng):
+        self.engine = engine
+        self.locations = locations
+        self.rng = rng
+        self.session_id = uuid.uuid4().hex
+        self.shown_ids = set()
+        self.last_filters = {}
+        members = rng.sample(range(n_users), k=rng.choice([0, 1, 1, 2, 3]))
+        self.nickname = ", ".join(f"유저{m}" for m in members)
+        self.has_recommended = False
+
+    def next_query(self):
+        roll = self.rng.random()
+        loc = self.rng.choice(self.locations)
+        if self.has_recommended and roll < 0.35:
+            return "다른거 추천해줘"
+        if roll < 0.45 and self.nickname:
+            return f"{loc} 테마{self.rng.randrange(2000)} 했어"
+        if roll < 0.55:
+            return f"유저{self.rng.randrange(50)}이랑 {loc} {self.rng.choice(KEYWORDS)} 추천"
+        extra = self.rng.choice(["", " 4점 이상", " 4명", " 둘이서"])
+        return f"{loc} {self.rng.choice(KEYWORDS)} 테마 추천해줘{extra}"
+
+    def step(self):
+        query = self.next_query()
+        reply_text, result_cards, used_filters, action, debug_info = self.engine.generate_reply(
+            query, user_context=self.nickname or None,
+            session_context={'session_id': self.session_id, 'shown_ids': self.shown_ids, 'last_filters': self.last_filters},
+        )
+        if result_cards:
+            self.has_recommended = True
+            if action == 'recommend': self.shown_ids = set()
+            self.last_filters = used_filters
+            for cards in result_cards.values():
+                self.shown_ids.update(c.id for c in cards)
+        # 로컬 대체 분석으로 답했으면 그 사유("llm_budget" / "llm_error"), 아니면 None
+        return action, ((debug_info or {}).get('intent') or {}).get('fallback')
+
+
+# ==============================================================================
+# [실행]
+# ==============================================================================
+def build_engine(db, llm, model, hybrid=True, scheduler=None, group_mode=GROUP_SCORING_MODE):
+    catalog = ThemeCatalog.load(db)
+    user_index = UserIndex.load(db)
+    vec_rec = VectorRecommender(db, model, user_index=user_index, catalog=catalog, group_mode=group_mode)
+    rule_rec = RuleBasedRecommender(db, user_index=user_index, catalog=catalog)
+    engine = EscapeBotEngine(vec_rec, rule_rec, None, None, catalog=catalog,
+                             hybrid_recommender=HybridRecommender(catalog, vec_rec) if hybrid else None,
+                             llm_scheduler=scheduler)
+    engine.groq_client = llm
+    engine.model_name = "stub"
+    return engine
+
+
+def start_catalog_sync(db, engine, mode="listener", poll_interval=1.0):
+    """
+    실행 중 플레이 기록 쓰기를 카탈로그/유저 인덱스에 반영하는 CatalogSync.
+    listener = 메모리 on_snapshot(운영과 같은 변경 피드 경로), polling = updated_at 워터마크 폴링
+    """
+    return CatalogSync(db, engine.catalog, engine.vector_recommender.user_index,
+                       poll_interval=poll_interval, use_listeners=(mode == "listener")).start()
+
+
+def run_level(engine, locations, n_users, concurrency, duration, seed):
+    latencies, errors, actions, degraded = [], 0, {}, {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(idx):
+        nonlocal errors
+        session = ChatSession(engine, locations, n_users, random.Random(seed * 1000 + idx))
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                action, fallback = session.step()
+                ok = True
+            except Exception:
+                action, fallback, ok = "exception", None, False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                actions[action] = actions.get(action, 0) + 1
+                if not ok: errors += 1
+                if fallback: degraded[fallback] = degraded.get(fallback, 0) + 1
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall = time.monotonic() - started
+
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        "error_rate": round(errors / max(len(latencies), 1), 4),
+        "degraded_rate": round(sum(degraded.values()) / max(len(latencies), 1), 4),
+        "degraded": degraded,
+        "actions": actions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="채팅 세션 동시성 부하 테스트 (스텁 LLM / 메모리 DB)")
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="동시 세션 수 단계 (쉼표 구분)")
+    parser.add_argument("--duration", type=float, default=15.0, help="단계별 실행 시간(초)")
+    parser.add_argument("--themes", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--max-played", type=int, default=200, help="유저별 최대 플레이 기록 수")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-failure", type=float, default=0.0, help="LLM 429 응답 비율")
+    parser.add_argument("--llm-retry-after", type=float, default=1.0, help="429 응답의 retry-after(초)")
+    parser.add_argument("--llm-rpm", type=int, default=0, help="LLM 스케줄러 분당 요청 한도 (0 = 스케줄러 없음)")
+    parser.add_argument("--llm-tpm", type=int, default=12000, help="LLM 스케줄러 분당 토큰 한도")
+    parser.add_argument("--db-latency", type=float, default=0.02, help="Firestore 쿼리당 지연(초)")
+    parser.add_argument("--ranking-mode", choices=["split", "hybrid"], default=RANKING_MODE, help="추천 랭킹 모드 (기본: config.RANKING_MODE)")
+    parser.add_argument("--group-mode", default=GROUP_SCORING_MODE, choices=["mean", "least_misery", "avg_sim"],
+                        help="그룹 맞춤 추천 점수 방식")
+    parser.add_argument("--sync", choices=["listener", "polling"], default="listener",
+                        help="카탈로그/유저 인덱스 동기화 방식 (listener = on_snapshot 변경 피드)")
+    parser.add_argument("--real-model", action="store_true", help="스텁 대신 실제 임베딩 모델 사용")
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    db = InMemoryFirestore()
+    locations = seed_database(db, args.themes, args.users, seed=args.seed, max_played=args.max_played)
+    db.read_latency = args.db_latency
+
+    if args.real_model:
+        from models import load_embed_model
+        model = load_embed_model()
+    else:
+        model = StubEmbedModel()
+    llm = StubGroq(args.llm_latency, args.llm_jitter, args.llm_failure, seed=args.seed, retry_after=args.llm_retry_after)
+    scheduler = LLMScheduler(rpm=args.llm_rpm, tpm=args.llm_tpm) if args.llm_rpm else None
+    engine = build_engine(db, llm, model, hybrid=args.ranking_mode == "hybrid", scheduler=scheduler,
+                          group_mode=args.group_mode)
+    sync = start_catalog_sync(db, engine, args.sync)
+
+    results = []
+    for level in [int(x) for x in args.levels.split(",") if x.strip()]:
+        result = run_level(engine, locations, args.users, level, args.duration, args.seed)
+        results.append(result)
+        if not args.json:
+            print(f"동시 {result['concurrency']:>3} | 요청 {result['requests']:>6} | {result['throughput_rps']:>7.2f} req/s | "
+                  f"p50 {result['p50_ms']:>8.1f}ms | p95 {result['p95_ms']:>8.1f}ms | p99 {result['p99_ms']:>8.1f}ms | "
+                  f"에러 {result['error_rate'] * 100:.2f}% | 저하 {result['degraded_rate'] * 100:.2f}%")
+
+    if args.json:
+        print(json.dumps({"args": vars(args), "results": results, "llm_calls": llm.calls, "llm_failures": llm.failures,
+                          "llm_scheduler": scheduler.stats() if scheduler else None, "sync_mode": sync.mode},
+                         ensure_ascii=False, indent=2))
+    sync.stop()
+
+
+if __name__ == "__main__":
+    main()
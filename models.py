@@ -1,7 +1,7 @@
 import os
 import streamlit as st
-from sentence_transformers import SentenceTransformer
 from config import EMBEDDING_MODEL_NAME, LOCAL_CACHE_DIR
+from encoder import BatchingEncoder
 
 try:
     from sentence_transformers import SentenceTransformer
@@ -9,6 +9,72 @@ try:
 except ImportError:
     EMBEDDING_AVAILABLE = False
 
+def _to_float(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+class Theme:
+    """
+    테마 카드 레코드. 카탈로그 로드 시 한 번 만들고 추천 결과에는 이 객체의 참조를 그대로 담습니다.
+    점수 필드는 미리 float로 변환되어 있고, 딕셔너리 변환(to_dict)은 UI / 워커 JSON 응답에서만 합니다.
+    """
+    __slots__ = ('id', 'title', 'store', 'location', 'desc',
+                 'rating', 'fear', 'difficulty', 'activity', 'problem', 'story', 'interior', 'act')
+
+    # 문서 필드 -> 속성
+    SCORE_FIELDS = {
+        'rating': 'satisfyTotalRating',
+        'fear': 'fearTotalRating',
+        'difficulty': 'difficultyTotalRating',
+        'activity': 'activityTotalRating',
+        'problem': 'problemTotalRating',
+        'story': 'storyTotalRating',
+        'interior': 'interiorTotalRating',
+        'act': 'actTotalRating',
+    }
+
+    def __init__(self, id, title=None, store=None, location=None, desc='', **scores):
+        self.id = id
+        self.title = title
+        self.store = store
+        self.location = location
+        self.desc = desc
+        for attr in self.SCORE_FIELDS:
+            setattr(self, attr, _to_float(scores.get(attr)))
+
+    @classmethod
+    def from_doc(cls, doc_id, data):
+        """themes 문서 -> Theme (설명은 150자까지)"""
+        return cls(
+            doc_id,
+            title=data.get('title'),
+            store=data.get('store_name'),
+            location=data.get('location'),
+            desc=(data.get('description') or '')[:150],
+            **{attr: data.get(field) for attr, field in cls.SCORE_FIELDS.items()},
+        )
+
+    @classmethod
+    def from_card(cls, card):
+        """to_dict() 형식의 카드 딕셔너리(사전 계산 Top-K 등) -> Theme"""
+        return cls(card['id'], card.get('title'), card.get('store'), card.get('location'), card.get('desc') or '',
+                   **{attr: card.get(attr) for attr in cls.SCORE_FIELDS})
+
+    def to_dict(self):
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+
+    def __eq__(self, other):
+        # 설명은 지연 로드되므로 비교에서 제외
+        if not isinstance(other, Theme): return NotImplemented
+        return all(getattr(self, a) == getattr(other, a) for a in self.__slots__ if a != 'desc')
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Theme({self.id!r}, {self.title!r}, rating={self.rating:.2f})"
+
 @st.cache_resource
 def load_embed_model():
     if not EMBEDDING_AVAILABLE: 
@@ -25,4 +91,10 @@ def load_embed_model():
         return model
     except Exception as e:
         st.error(f"임베딩 모델 로드 실패: {e}")
-        return None
\ No newline at end of file
+        return None
+
+@st.cache_resource
+def load_batching_encoder():
+    """세션 간 공유되는 마이크로 배치 인코더 (load_embed_model 앞단)"""
+    model = load_embed_model()
+    return BatchingEncoder(model) if model else None
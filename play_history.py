@@ -0,0 +1,138 @@
+"""
+플레이 기록 저장 형식.
+
+users 문서의 played_packed 필드에 정렬된 고유 테마 ID(uint32 little-endian)를 bytes로 저장합니다.
+played_packed가 있는 문서는 그 값만 기록으로 보고, 없는 문서(미변환)만 기존 played 배열을 읽습니다.
+config.PLAYED_LEGACY_WRITES가 켜져 있으면 배열을 읽는 외부 파이프라인을 위해 played 배열에도 같은 추가/삭제를 적용하고,
+--drop-legacy로 배열을 지운 문서에는 played_legacy_dropped 표시를 남겨 이후 쓰기가 배열을 다시 만들지 않게 합니다.
+
+    python play_history.py --migrate                # played 배열 내용을 played_packed에 합침 (played 유지)
+    python play_history.py --migrate --drop-legacy  # PLAYED_LEGACY_WRITES = False로 바꾼 뒤: played 배열 제거
+"""
+import argparse
+
+import numpy as np
+
+from database import firestore, run_transaction
+from config import PLAYED_LEGACY_WRITES
+
+PLAYED_PACKED_FIELD = 'played_packed'
+LEGACY_PLAYED_FIELD = 'played'
+LEGACY_DROPPED_FIELD = 'played_legacy_dropped'
+# 미변환 문서도 읽어야 하는 일괄 로드용 (--drop-legacy 이후엔 배열이 없으므로 packed만 전송됨)
+PLAYED_FIELDS = [PLAYED_PACKED_FIELD, LEGACY_PLAYED_FIELD]
+
+_DTYPE = np.dtype('<u4')
+EMPTY_PLAYED = np.zeros(0, dtype=np.int64)
+
+
+def normalize_played(theme_ids):
+    """정수로 바꿀 수 있는 ID만 모아 정렬된 고유 int64 배열로"""
+    if isinstance(theme_ids, np.ndarray):
+        return np.unique(theme_ids.astype(np.int64))
+    values = []
+    for tid in theme_ids or []:
+        try: values.append(int(tid))
+        except (TypeError, ValueError): pass
+    return np.unique(np.asarray(values, dtype=np.int64))
+
+
+def encode_played(played):
+    played = normalize_played(played)
+    return played[(played >= 0) & (played <= np.iinfo(_DTYPE).max)].astype(_DTYPE).tobytes()
+
+
+def _unpack(packed):
+    return np.frombuffer(packed, dtype=_DTYPE).astype(np.int64) if packed else EMPTY_PLAYED
+
+
+def decode_played(data):
+    """users 문서 딕셔너리 -> 정렬된 고유 int64 배열 (packed가 있으면 packed만, 없으면 기존 배열)"""
+    if PLAYED_PACKED_FIELD in data: return _unpack(data[PLAYED_PACKED_FIELD])
+    return normalize_played(data.get(LEGACY_PLAYED_FIELD))
+
+
+def _packed_update(played, legacy=None):
+    """packed 필드 갱신. legacy가 주어지면 played 배열에 같이 적용할 변환(ArrayUnion / ArrayRemove / DELETE_FIELD)"""
+    update = {
+        PLAYED_PACKED_FIELD: encode_played(played),
+        'played_count': int(len(played)),
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    }
+    if legacy is not None: update[LEGACY_PLAYED_FIELD] = legacy
+    return update
+
+
+def write_played(db, user_ref, theme_ids, played=True, legacy_writes=PLAYED_LEGACY_WRITES):
+    """
+    트랜잭션으로 플레이 기록을 추가/삭제하고 새 기록 배열을 반환합니다.
+    packed가 있는 문서는 packed만 읽고, 없는 문서만 기존 배열을 한 번 읽어 packed로 옮깁니다.
+    legacy_writes가 켜져 있고 배열을 지우지 않은 문서면 played 배열에도 같은 추가/삭제를 적용합니다.
+    """
+    theme_ids = normalize_played(theme_ids if isinstance(theme_ids, (list, set, tuple, np.ndarray)) else [theme_ids])
+    ids = [int(tid) for tid in theme_ids.tolist()]
+    # 배열에 문자열로 들어간 ID도 함께 지워야 배열만 읽는 쪽에서 다시 살아나지 않음
+    legacy = firestore.ArrayUnion(ids) if played else firestore.ArrayRemove(ids + [str(tid) for tid in ids])
+
+    def apply(transaction):
+        data = user_ref.get(field_paths=[PLAYED_PACKED_FIELD, LEGACY_DROPPED_FIELD], transaction=transaction).to_dict() or {}
+        if PLAYED_PACKED_FIELD not in data:
+            data = user_ref.get(field_paths=PLAYED_FIELDS, transaction=transaction).to_dict() or {}
+        current = decode_played(data)
+        updated = np.union1d(current, theme_ids) if played else np.setdiff1d(current, theme_ids, assume_unique=True)
+        keep_legacy = legacy_writes and not data.get(LEGACY_DROPPED_FIELD)
+        transaction.update(user_ref, _packed_update(updated, legacy if keep_legacy else None))
+        return updated
+
+    return run_transaction(db, apply)
+
+
+def migrate_play_history(db, batch_size=400, drop_legacy=False, log_func=None):
+    """
+    played 배열이 있는 유저 문서의 played_packed를 (packed ∪ 배열)로 채웁니다. 외부 파이프라인이 배열에만 쓴 기록도 여기서 합쳐집니다.
+    drop_legacy=True일 때만 played 배열을 제거하고 played_legacy_dropped 표시를 남깁니다.
+    (PLAYED_LEGACY_WRITES = False로 바꾸고 배열을 읽는 곳이 모두 사라진 뒤에 실행)
+    """
+    batch, pending, migrated = db.batch(), 0, 0
+    for doc in db.collection('users').select(PLAYED_FIELDS).stream():
+        data = doc.to_dict() or {}
+        if LEGACY_PLAYED_FIELD not in data: continue
+        packed_only = _unpack(data.get(PLAYED_PACKED_FIELD))
+        played = np.union1d(packed_only, normalize_played(data[LEGACY_PLAYED_FIELD]))
+        if not drop_legacy and PLAYED_PACKED_FIELD in data and np.array_equal(played, packed_only): continue
+        update = _packed_update(played, firestore.DELETE_FIELD if drop_legacy else None)
+        if drop_legacy: update[LEGACY_DROPPED_FIELD] = True
+        batch.update(doc.reference, update)
+        pending += 1
+        migrated += 1
+        if pending >= batch_size:
+            batch.commit()
+            batch, pending = db.batch(), 0
+            if log_func: log_func(f"[PlayHistory] {migrated}명 변환")
+    if pending: batch.commit()
+    if log_func: log_func(f"[PlayHistory] 변환 완료: {migrated}명")
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="플레이 기록 packed 형식 마이그레이션")
+    parser.add_argument("--migrate", action="store_true", help="played 배열 내용을 played_packed에 채움 (배열은 유지)")
+    parser.add_argument("--drop-legacy", action="store_true", help="--migrate와 함께: played 배열 제거 (되돌릴 수 없음)")
+    parser.add_argument("--batch-size", type=int, default=400)
+    args = parser.parse_args()
+    if not args.migrate:
+        parser.print_help()
+        return
+
+    if args.drop_legacy and PLAYED_LEGACY_WRITES:
+        raise SystemExit("config.PLAYED_LEGACY_WRITES가 켜져 있으면 다음 기록 쓰기가 played 배열을 다시 만듭니다. False로 바꾼 뒤 실행하세요.")
+
+    from database import init_firebase
+    db = init_firebase()
+    if not db:
+        raise SystemExit("Firebase 연결 실패")
+    migrate_play_history(db, args.batch_size, drop_legacy=args.drop_legacy, log_func=print)
+
+
+if __name__ == "__main__":
+    main()
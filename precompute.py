@@ -0,0 +1,233 @@
+"""
+개인화 Top-K 사전 계산 배치 작업.
+
+    python precompute.py --k 50 --backend local
+    python precompute.py --k 50 --backend firestore
+
+모든 유저/테마 임베딩을 한 번에 로드하고, 유저 블록 x 테마 행렬 곱을
+프로세스 풀에서 계산해 유저별 Top-K(플레이한 테마 제외)를 저장합니다.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import streamlit as st
+
+from catalog import ThemeCatalog, to_vector_list
+from play_history import PLAYED_FIELDS, decode_played
+from config import TOPK_STORE_BACKEND, TOPK_STORE_PATH, TOPK_COLLECTION
+
+# ==============================================================================
+# [저장소] 로컬 파일 / Firestore 캐시 컬렉션
+# ==============================================================================
+class TopKStore:
+    """
+    유저별 사전 계산 Top-K 테이블.
+    backend="local"이면 JSON 파일을 메모리 딕셔너리로 서빙하고(배치가 파일을 새로 쓰면 mtime/크기로 감지해 다시 읽음),
+    backend="firestore"면 닉네임 해시를 문서 ID로 하는 단건 조회로 서빙합니다.
+    catalog가 주어지면 catalog_version이 현재 카탈로그 지문(멤버십 + 임베딩)과 다른 항목은 무시합니다.
+    """
+    def __init__(self, backend="local", path=TOPK_STORE_PATH, db=None, catalog=None):
+        self.backend = backend
+        self.path = path
+        self.db = db
+        self.catalog = catalog
+        self._table = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _doc_key(nickname):
+        return hashlib.sha1(nickname.encode('utf-8')).hexdigest()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load_local(self):
+        """파일이 바뀌었을 때만 다시 읽습니다 (invalidate로 지운 항목은 다음 파일까지 유지)"""
+        stamp = self._file_stamp()
+        with self._lock:
+            if self._table is not None and stamp == self._stamp: return self._table
+            table = {}
+            if stamp is not None:
+                with open(self.path, encoding='utf-8') as f:
+                    payload = json.load(f)
+                version = payload.get('catalog_version')
+                for nickname, items in payload.get('users', {}).items():
+                    table[nickname] = {'catalog_version': version, 'items': items}
+            self._table, self._stamp = table, stamp
+            return table
+
+    def _is_current(self, entry):
+        if self.catalog is None: return True
+        return entry.get('catalog_version') == self.catalog.fingerprint()
+
+    def get(self, nickname):
+        """사전 계산된 카드 리스트. 없거나 카탈로그 버전이 다르면 None"""
+        try:
+            if self.backend == "firestore":
+                snap = self.db.collection(TOPK_COLLECTION).document(self._doc_key(nickname)).get()
+                entry = snap.to_dict() if snap.exists else None
+            else:
+                entry = self._load_local().get(nickname)
+        except Exception:
+            return None
+        if not entry or not self._is_current(entry): return None
+        return entry.get('items')
+
+    def invalidate(self, nickname):
+        """
+        플레이 기록 변경 시 해당 유저 항목을 버립니다 (다음 배치까지 실시간 검색).
+        local 백엔드는 이 프로세스의 메모리 테이블만 지우므로, 서빙하는 쪽(VectorRecommender)에서
+        현재 플레이 기록으로 항목을 한 번 더 걸러 다른 프로세스의 기록도 반영합니다.
+        """
+        try:
+            if self.backend == "firestore":
+                self.db.collection(TOPK_COLLECTION).document(self._doc_key(nickname)).delete()
+            else:
+                table = self._load_local()
+                with self._lock:
+                    table.pop(nickname, None)
+        except Exception:
+            pass
+
+    def write(self, results, catalog_version):
+        if self.backend == "firestore":
+            batch = self.db.batch()
+            for i, (nickname, items) in enumerate(results.items(), 1):
+                ref = self.db.collection(TOPK_COLLECTION).document(self._doc_key(nickname))
+                batch.set(ref, {'nickname': nickname, 'catalog_version': catalog_version, 'items': items})
+                if i % 400 == 0:
+                    batch.commit()
+                    batch = self.db.batch()
+            batch.commit()
+        else:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding='utf-8') as f:
+                json.dump({'catalog_version': catalog_version, 'users': results}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        with self._lock:
+            self._table = None
+
+
+@st.cache_resource
+def load_topk_store(_db, _catalog=None):
+    return TopKStore(TOPK_STORE_BACKEND, TOPK_STORE_PATH, db=_db, catalog=_catalog)
+
+
+# ==============================================================================
+# [배치 계산] 유저 블록 x 테마 행렬 곱
+# ==============================================================================
+_THEME_MATRIX = None
+_THEME_VALID = None
+
+def _init_worker(theme_matrix, theme_valid):
+    global _THEME_MATRIX, _THEME_VALID
+    _THEME_MATRIX = theme_matrix
+    _THEME_VALID = theme_valid
+
+
+def _topk_block(args):
+    start, user_block, played_rows, k = args
+    scores = user_block @ _THEME_MATRIX.T
+    scores[:, ~_THEME_VALID] = -np.inf
+    for i, rows in enumerate(played_rows):
+        if rows: scores[i, rows] = -np.inf
+
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return start, np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def load_user_profiles(db, catalog, log_func=None):
+    """임베딩이 있는 유저의 (닉네임, 정규화 벡터 행렬, 플레이 테마 행 목록)"""
+    nicknames, vectors, played_rows = [], [], []
+    dim = catalog.embeddings.shape[1]
+    for doc in db.collection('users').select(['nickname', 'embedding_field'] + PLAYED_FIELDS).stream():
+        data = doc.to_dict()
+        nickname = data.get('nickname')
+        try:
+            vector = to_vector_list(data.get('embedding_field'))
+        except Exception:
+            vector = None
+        if not nickname or not vector or len(vector) != dim: continue
+
+        nicknames.append(nickname)
+        vectors.append(vector)
+        played_rows.append(catalog.rows_for_ref_ids(decode_played(data)).tolist())
+
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), dim)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    if log_func: log_func(f"[Users] 임베딩 보유 유저 {len(nicknames)}명 로드")
+    return nicknames, matrix, played_rows
+
+
+def compute_user_topk(catalog, user_matrix, played_rows, k=50, block_size=256, workers=None):
+    """유저별 (테마 행 인덱스, 점수) Top-K 배열을 반환합니다."""
+    n_users = len(user_matrix)
+    top_rows = np.zeros((n_users, min(k, len(catalog))), dtype=np.int64)
+    top_scores = np.zeros(top_rows.shape, dtype=np.float32)
+    if n_users == 0 or len(catalog) == 0: return top_rows, top_scores
+
+    tasks = [
+        (start, user_matrix[start:start + block_size], played_rows[start:start + block_size], k)
+        for start in range(0, n_users, block_size)
+    ]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(catalog.embeddings, catalog.has_embedding)) as pool:
+        for start, rows, scores in pool.map(_topk_block, tasks):
+            top_rows[start:start + len(rows)] = rows
+            top_scores[start:start + len(rows)] = scores
+    return top_rows, top_scores
+
+
+def build_results(catalog, nicknames, top_rows, top_scores):
+    results = {}
+    for nickname, rows, scores in zip(nicknames, top_rows, top_scores):
+        items = []
+        for row, score in zip(rows.tolist(), scores.tolist()):
+            if not np.isfinite(score): break
+            items.append({**catalog.records[row].to_dict(), 'score': score})
+        results[nickname] = items
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="개인화 Top-K 사전 계산")
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--block-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--backend", choices=["local", "firestore"], default="local")
+    parser.add_argument("--path", default=TOPK_STORE_PATH)
+    args = parser.parse_args()
+
+    from database import init_firebase
+    db = init_firebase()
+    if not db:
+        raise SystemExit("Firebase 연결 실패")
+
+    started = time.time()
+    catalog = ThemeCatalog.load(db, log_func=print)
+    nicknames, user_matrix, played_rows = load_user_profiles(db, catalog, log_func=print)
+    top_rows, top_scores = compute_user_topk(catalog, user_matrix, played_rows, args.k, args.block_size, args.workers)
+
+    results = build_results(catalog, nicknames, top_rows, top_scores)
+    TopKStore(args.backend, args.path, db=db).write(results, catalog.fingerprint())
+    print(f"[Done] {len(results)}명 Top-{args.k} 저장 (catalog_version={catalog.fingerprint()}, {time.time() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
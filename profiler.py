@@ -0,0 +1,220 @@
+import importlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+# ==============================================================================
+# [요청 프로파일러] 디버그 모드에서 generate_reply 한 번을 샘플링 프로파일링
+# ==============================================================================
+
+# 프로파일링 중에만 감싸서 벽시계 시간을 재는 외부 호출 (모듈, 클래스, 메서드, 라벨)
+IO_TARGETS = [
+    ("google.cloud.firestore_v1.query", "Query", "stream", "firestore.query"),
+    ("google.cloud.firestore_v1.collection", "CollectionReference", "stream", "firestore.query"),
+    ("google.cloud.firestore_v1.document", "DocumentReference", "get", "firestore.get"),
+    ("google.cloud.firestore_v1.document", "DocumentReference", "set", "firestore.write"),
+    ("google.cloud.firestore_v1.document", "DocumentReference", "update", "firestore.write"),
+    ("google.cloud.firestore_v1.client", "Client", "get_all", "firestore.get_all"),
+    ("google.cloud.firestore_v1.batch", "WriteBatch", "commit", "firestore.write"),
+    ("groq.resources.chat.completions", "Completions", "create", "groq.chat"),
+]
+
+# 메서드 패치는 프로세스 전역이므로 프로파일링은 한 번에 하나씩만 수행
+_PATCH_LOCK = threading.Lock()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _IOTimer:
+    """
+    대상 스레드에서 일어난 호출만 라벨별로 집계 (스트림은 다 읽을 때까지의 시간 포함).
+    감싼 메서드가 다른 감싼 메서드를 부르면(CollectionReference.stream -> Query.stream,
+    DocumentReference.get -> Client.get_all 등) 바깥 호출만 기록해 같은 시간을 두 번 세지 않습니다.
+    """
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.calls = defaultdict(list)
+        self._originals = []
+        self._depth = 0
+
+    def _record(self, label, elapsed):
+        self.calls[label].append(elapsed)
+
+    def _wrap(self, label, original):
+        timer = self
+
+        def timed_stream(iterator, spent):
+            try:
+                while True:
+                    t0 = time.perf_counter()
+                    timer._depth += 1
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        spent += time.perf_counter() - t0
+                        break
+                    finally:
+                        timer._depth -= 1
+                    spent += time.perf_counter() - t0
+                    yield item
+            finally:
+                timer._record(label, spent)
+
+        def wrapper(*args, **kwargs):
+            if threading.get_ident() != timer.thread_id or timer._depth:
+                return original(*args, **kwargs)
+            started = time.perf_counter()
+            timer._depth += 1
+            try:
+                result = original(*args, **kwargs)
+            except Exception:
+                timer._record(label, time.perf_counter() - started)
+                raise
+            finally:
+                timer._depth -= 1
+            spent = time.perf_counter() - started
+            if hasattr(result, '__next__'):
+                return timed_stream(result, spent)
+            timer._record(label, spent)
+            return result
+
+        return wrapper
+
+    def install(self):
+        for module_name, class_name, method_name, label in IO_TARGETS:
+            try:
+                cls = getattr(importlib.import_module(module_name), class_name)
+                original = cls.__dict__[method_name]
+            except Exception:
+                continue
+            setattr(cls, method_name, self._wrap(label, original))
+            self._originals.append((cls, method_name, original))
+
+    def uninstall(self):
+        for cls, method_name, original in reversed(self._originals):
+            setattr(cls, method_name, original)
+        self._originals = []
+
+    def summary(self):
+        result = {}
+        for label, times in sorted(self.calls.items()):
+            result[label] = {
+                "calls": len(times),
+                "total_ms": round(sum(times) * 1000, 1),
+                "max_ms": round(max(times) * 1000, 1),
+            }
+        return result
+
+
+class RequestProfiler:
+    """
+    with RequestProfiler() as prof:
+        engine.generate_reply(...)
+    prof.report() -> 벽시계 시간, 상위 N개 함수(self/total 샘플), Firestore/Groq 호출 시간
+    prof.collapsed() -> flamegraph.pl / speedscope에서 읽는 collapsed stack 텍스트
+
+    sys._current_frames()로 호출 스레드의 스택을 interval마다 샘플링합니다.
+    컨텍스트 밖에서는 아무 것도 설치되어 있지 않으므로 비활성 시 오버헤드가 없습니다.
+    """
+    def __init__(self, interval=0.005, top_n=25, time_io=True):
+        self.interval = interval
+        self.top_n = top_n
+        self.time_io = time_io
+        self.stacks = Counter()
+        self.samples = 0
+        self.wall = 0.0
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._io = None
+        self._locked = False
+
+    def _sample_loop(self):
+        own_files = {__file__}
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                if frame.f_code.co_filename not in own_files:
+                    stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        if self.time_io:
+            _PATCH_LOCK.acquire()
+            self._locked = True
+            self._io = _IOTimer(self._thread_id)
+            self._io.install()
+        self._sampler = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+        self._started = time.perf_counter()
+        self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall = time.perf_counter() - self._started
+        self._stop.set()
+        self._sampler.join()
+        if self._io:
+            self._io.uninstall()
+        if self._locked:
+            _PATCH_LOCK.release()
+            self._locked = False
+        return False
+
+    def collapsed(self):
+        out = io.StringIO()
+        for stack, count in self.stacks.most_common():
+            out.write(";".join(stack) + f" {count}\n")
+        return out.getvalue()
+
+    def hot_functions(self):
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            self_counts[stack[-1]] += count
+            for label in set(stack):
+                total_counts[label] += count
+        samples = max(self.samples, 1)
+        top = []
+        for label, count in self_counts.most_common(self.top_n):
+            top.append({
+                "function": label,
+                "self": count,
+                "total": total_counts[label],
+                "self_pct": round(100.0 * count / samples, 1),
+            })
+        return top
+
+    def report(self):
+        return {
+            "wall_ms": round(self.wall * 1000, 1),
+            "samples": self.samples,
+            "interval_ms": self.interval * 1000,
+            "top": self.hot_functions(),
+            "io": self._io.summary() if self._io else {},
+        }
+
+    def to_json(self):
+        return json.dumps({**self.report(), "collapsed": self.collapsed()}, ensure_ascii=False, indent=2)
+
+
+def profile_payload(prof):
+    """UI / 워커 응답용 직렬화 가능한 프로파일 요약"""
+    return {"report": prof.report(), "collapsed": prof.collapsed(), "json": prof.to_json()}
+
+
+def profile_call(func, *args, interval=0.005, top_n=25, **kwargs):
+    """func(*args, **kwargs) 한 번을 프로파일링 -> (반환값, 프로파일러)"""
+    with RequestProfiler(interval=interval, top_n=top_n) as prof:
+        result = func(*args, **kwargs)
+    return result, prof
@@ -1,11 +1,86 @@
 import numpy as np
 from database import firestore, Vector, DistanceMeasure, FieldFilter
-from utils import sort_candidates_by_query
-from config import PROJECT_ID
+from utils import sort_candidates_by_query, query_sort_spec
+from config import PROJECT_ID, GROUP_SCORING_MODE, FIRESTORE_IN_LIMIT
+from catalog import THEME_CARD_FIELDS, THEME_VECTOR_FIELDS
+from models import Theme
+from play_history import PLAYED_FIELDS, EMPTY_PLAYED, decode_played
+
+def group_members(nicknames):
+    """'a, b' 문자열 또는 리스트 -> 닉네임 리스트 (인원 제한 없음)"""
+    if isinstance(nicknames, str): nicknames = nicknames.split(',')
+    elif not isinstance(nicknames, list): return []
+    return [n.strip() for n in nicknames if n and n.strip()]
+
+
+def stream_users(db, nicknames, fields):
+    """닉네임 'in' 쿼리를 FIRESTORE_IN_LIMIT명씩 나눠 실행해 모든 멤버의 users 문서를 스트리밍합니다."""
+    users_ref = db.collection('users')
+    for start in range(0, len(nicknames), FIRESTORE_IN_LIMIT):
+        chunk = nicknames[start:start + FIRESTORE_IN_LIMIT]
+        yield from users_ref.where(filter=FieldFilter("nickname", "in", chunk)).select(fields).stream()
+
+
+def member_vectors(vectors, catalog=None):
+    """
+    멤버 임베딩 중 테마 임베딩과 차원이 같은 것만 남깁니다.
+    카탈로그가 없으면 모두 같은 차원일 때만 사용하고, 섞여 있으면 빈 리스트를 반환합니다.
+    """
+    vectors = [v for v in vectors if v is not None]
+    dim = catalog.embeddings.shape[1] if catalog is not None else 0
+    if dim: return [v for v in vectors if v.shape[0] == dim]
+    return vectors if len({v.shape[0] for v in vectors}) <= 1 else []
+
+
+def indexed_users(user_index, target_users):
+    """UserIndex에 모든 유저가 있으면 [(임베딩, 플레이 ID 배열), ...], 하나라도 없으면 None"""
+    if user_index is None: return None
+    entries = [user_index.get(n) for n in target_users]
+    return None if any(e is None for e in entries) else entries
+
+
+def catalog_records(catalog, docs):
+    """
+    [(문서 ID, 문서 데이터), ...] -> Theme 리스트.
+    카탈로그에 있는 테마는 공유 레코드를 그대로 참조하고, 없을 때만(카탈로그 없음/동기화 전) 새로 만듭니다.
+    """
+    shared = catalog.records_for_ids([doc_id for doc_id, _ in docs]) if catalog is not None else [None] * len(docs)
+    return [record or Theme.from_doc(doc_id, data) for (doc_id, data), record in zip(docs, shared)]
+
+
+def group_scores(members, theme_matrix, mode="mean"):
+    """
+    멤버 임베딩(m x d)과 테마 임베딩(n x d) -> 테마별 그룹 점수(n).
+    - mean: 정규화한 평균 벡터와의 유사도 (기존 방식)
+    - least_misery: 멤버별 유사도를 각자 분포로 표준화한 뒤 최솟값 (모두가 괜찮은 테마)
+    - avg_sim: 같은 표준화 유사도의 평균 (취향 폭이 넓은 멤버가 순위를 독점하지 않음)
+    원시 코사인 유사도의 평균은 평균 벡터와 순위가 같으므로 멤버별로 표준화해서 합칩니다.
+    """
+    if mode == "mean" or len(members) == 1:
+        target = members.mean(axis=0)
+        norm = np.linalg.norm(target)
+        if norm > 0: target = target / norm
+        return theme_matrix @ target
+
+    sims = members @ theme_matrix.T
+    if sims.shape[1] > 1:
+        sims = (sims - sims.mean(axis=1, keepdims=True)) / np.maximum(sims.std(axis=1, keepdims=True), 1e-6)
+    return sims.min(axis=0) if mode == "least_misery" else sims.mean(axis=0)
+
+
+def top_k_order(scores, k):
+    """점수 상위 k개의 인덱스 (내림차순, 동점은 인덱스 순)"""
+    k = min(k, len(scores))
+    if k <= 0: return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return top[np.lexsort((top, -scores[top]))]
+
 
 class RuleBasedRecommender:
-    def __init__(self, db):
+    def __init__(self, db, user_index=None, catalog=None):
         self.db = db
+        self.user_index = user_index
+        self.catalog = catalog
 
     def search_themes(self, criteria, user_query="", limit=30, nicknames=None, exclude_ids=None, log_func=None):
         locs_input = criteria.get('locations', [])
@@ -24,22 +99,18 @@ class RuleBasedRecommender:
         played_theme_ids = set()
         
         # 1. 이력 조회
-        target_users = []
-        if isinstance(nicknames, str):
-            target_users = [n.strip() for n in nicknames.split(',') if n.strip()]
-        elif isinstance(nicknames, list):
-            target_users = nicknames
+        target_users = group_members(nicknames)
 
-        if target_users:
+        indexed = self.user_index.played_union(target_users) if self.user_index and target_users else None
+        if indexed is not None:
+            played_theme_ids.update(indexed.tolist())
+            if log_func: log_func(f"   -> {len(target_users)}명 플레이 기록 {len(played_theme_ids)}개 제외 (인덱스)")
+        elif target_users:
             try:
-                users_ref = self.db.collection('users')
-                if len(target_users) > 10: target_users = target_users[:10]
-                user_q = users_ref.where(filter=FieldFilter("nickname", "in", target_users))
-                user_docs = list(user_q.stream())
+                user_docs = list(stream_users(self.db, target_users, PLAYED_FIELDS))
                 
                 for u_doc in user_docs:
-                    played = u_doc.to_dict().get('played', [])
-                    for pid in played: played_theme_ids.add(int(pid))
+                    played_theme_ids.update(decode_played(u_doc.to_dict()).tolist())
                 
                 if log_func: log_func(f"   -> {len(target_users)}명 플레이 기록 {len(played_theme_ids)}개 제외")
             except Exception as e:
@@ -50,7 +121,8 @@ class RuleBasedRecommender:
 
         # 2. DB 쿼리
         themes_ref = self.db.collection('themes')
-        query = themes_ref.order_by('satisfyTotalRating', direction="DESCENDING").limit(200)
+        # 임베딩/설명 없이 필터와 정렬에 필요한 필드만 조회
+        query = themes_ref.select(THEME_CARD_FIELDS).order_by('satisfyTotalRating', direction="DESCENDING").limit(200)
 
         docs = list(query.stream())
         raw_candidates = []
@@ -95,45 +167,68 @@ class RuleBasedRecommender:
                 except:
                     pass
 
-            # 벡터 저장
-            vec_obj = data.get('embedding_field')
-            vector = None
-            try:
-                if vec_obj: vector = vec_obj.to_map()['value'] if hasattr(vec_obj, 'to_map') else list(vec_obj)
-            except: pass
-
-            raw_candidates.append({
-                'id': doc.id,
-                'title': data.get('title'),
-                'store': data.get('store_name'),
-                'location': data.get('location'),
-                'desc': data.get('description', '')[:150],
-                'rating': float(data.get('satisfyTotalRating') or 0),
-                'fear': float(data.get('fearTotalRating') or 0),
-                'activity': float(data.get('activityTotalRating') or 0),
-                'difficulty': float(data.get('difficultyTotalRating') or 0),
-                'vector': vector
-            })
-
-        sorted_candidates = sort_candidates_by_query(raw_candidates, user_query)
+            raw_candidates.append((doc.id, data))
+
+        sorted_candidates = sort_candidates_by_query(catalog_records(self.catalog, raw_candidates), user_query)
         if log_func: log_func(f"   -> [Rule] 필터링 후 {len(sorted_candidates)}개 후보 발견")
         
         return sorted_candidates[:limit]
 
 
 class VectorRecommender:
-    def __init__(self, db, model):
+    def __init__(self, db, model, topk_store=None, encoder=None, user_index=None, catalog=None,
+                 group_mode=GROUP_SCORING_MODE):
         self.db = db
         self.model = model
+        self.topk_store = topk_store
+        self.encoder = encoder
+        self.user_index = user_index
+        self.catalog = catalog
+        self.group_mode = group_mode
+
+    def get_member_matrix(self, nicknames, log_func=None):
+        """임베딩이 있는 멤버들의 정규화 벡터 행렬 (멤버 x 차원) / 없으면 None"""
+        target_users = group_members(nicknames)
+        if not target_users: return None
+
+        # 차원이 다른 임베딩(모델 교체 중 등)은 인덱스/Firestore 어느 경로든 제외
+        entries = indexed_users(self.user_index, target_users)
+        if entries is not None:
+            vectors = member_vectors([vec for vec, _ in entries], self.catalog)
+            return np.stack(vectors).astype(np.float32) if vectors else None
+
+        vectors = []
+        try:
+            for doc in stream_users(self.db, target_users, ['embedding_field']):
+                vec_obj = doc.to_dict().get('embedding_field')
+                if vec_obj:
+                    try:
+                        v = vec_obj.to_map()['value'] if hasattr(vec_obj, 'to_map') else list(vec_obj)
+                        v = np.asarray(v, dtype=np.float32)
+                        norm = np.linalg.norm(v)
+                        if norm > 0: vectors.append(v / norm)
+                    except: pass
+        except Exception as e:
+            if log_func: log_func(f"   ⚠️ 벡터 계산 실패: {e}")
+            return None
+
+        vectors = member_vectors(vectors, self.catalog)
+        return np.stack(vectors) if vectors else None
 
     def get_group_vector(self, nicknames, log_func=None):
-        target_users = [n.strip() for n in nicknames if n.strip()] if isinstance(nicknames, list) else ([n.strip() for n in nicknames.split(',')] if nicknames else [])
+        target_users = group_members(nicknames)
         if not target_users: return None
 
+        entries = indexed_users(self.user_index, target_users)
+        if entries is not None:
+            vectors = member_vectors([vec for vec, _ in entries], self.catalog)
+            if not vectors: return None
+            mean_vector = np.mean(np.array(vectors), axis=0)
+            norm = np.linalg.norm(mean_vector)
+            return (mean_vector / norm).tolist() if norm > 0 else mean_vector.tolist()
+
         try:
-            users_ref = self.db.collection('users')
-            if len(target_users) > 10: target_users = target_users[:10]
-            docs = list(users_ref.where(filter=FieldFilter("nickname", "in", target_users)).stream())
+            docs = list(stream_users(self.db, target_users, ['embedding_field']))
             
             vectors = []
             for doc in docs:
@@ -141,9 +236,10 @@ class VectorRecommender:
                 if vec_obj:
                     try:
                         v = vec_obj.to_map()['value'] if hasattr(vec_obj, 'to_map') else list(vec_obj)
-                        vectors.append(v)
+                        vectors.append(np.asarray(v, dtype=np.float32))
                     except: pass
             
+            vectors = member_vectors(vectors, self.catalog)
             if not vectors: return None
             
             mean_vector = np.mean(np.array(vectors), axis=0)
@@ -154,37 +250,37 @@ class VectorRecommender:
             if log_func: log_func(f"   ⚠️ 벡터 계산 실패: {e}")
             return None
 
-    def _get_played_ids_internal(self, user_context, log_func=None):
-        played_ids = set()
-        if not user_context: return played_ids
+    def get_played_array(self, user_context, log_func=None):
+        """그룹 전체의 플레이 테마 ID (정렬된 int64 배열)"""
+        if not user_context: return EMPTY_PLAYED
         
-        target_users = []
-        if isinstance(user_context, str):
-            target_users = [n.strip() for n in user_context.split(',') if n.strip()]
-        elif isinstance(user_context, list):
-            target_users = user_context
-            
-        if not target_users: return played_ids
+        target_users = group_members(user_context)
+        if not target_users: return EMPTY_PLAYED
+
+        indexed = self.user_index.played_union(target_users) if self.user_index else None
+        if indexed is not None:
+            if log_func: log_func(f"   -> [Vector] {len(target_users)}명 이력 {len(indexed)}개 로드 (인덱스)")
+            return indexed
 
+        arrays = []
         try:
-            users_ref = self.db.collection('users')
-            if len(target_users) > 10: target_users = target_users[:10]
-            user_q = users_ref.where(filter=FieldFilter("nickname", "in", target_users))
-            docs = user_q.stream()
-            for doc in docs:
-                played = doc.to_dict().get('played', [])
-                for pid in played:
-                    played_ids.add(int(pid))
-            if log_func: log_func(f"   -> [Vector] {len(target_users)}명 이력 {len(played_ids)}개 로드")
+            for doc in stream_users(self.db, target_users, PLAYED_FIELDS):
+                arrays.append(decode_played(doc.to_dict()))
         except Exception as e:
             if log_func: log_func(f"   ⚠️ [Vector] 이력 조회 에러: {e}")
-            
-        return played_ids
+
+        played = np.unique(np.concatenate(arrays)) if arrays else EMPTY_PLAYED
+        if log_func: log_func(f"   -> [Vector] {len(target_users)}명 이력 {len(played)}개 로드")
+        return played
+
+    def _get_played_ids_internal(self, user_context, log_func=None):
+        return set(self.get_played_array(user_context, log_func).tolist())
 
     def _execute_vector_search(self, vector, limit=20, filters=None, exclude_ids=None, log_func=None):
         try:
             themes_ref = self.db.collection('themes')
-            query = themes_ref
+            # 설명은 제외 (응답 카드에 한해 지연 로드)
+            query = themes_ref.select(THEME_VECTOR_FIELDS)
             
             locs_input = filters.get('locations', []) if filters else []
             min_rating = filters.get('min_rating') if filters else None
@@ -254,54 +350,174 @@ class VectorRecommender:
                 except:
                     score = 0
                 
-                candidates.append({
-                    'id': doc.id,
-                    'title': data.get('title'),
-                    'store': data.get('store_name'),
-                    'location': data.get('location'),
-                    'desc': data.get('description', '')[:150],
-                    'rating': float(data.get('satisfyTotalRating') or 0),
-                    'fear': float(data.get('fearTotalRating') or 0),
-                    'difficulty': float(data.get('difficultyTotalRating') or 0),
-                    'activity': float(data.get('activityTotalRating') or 0),
-                    'problem': float(data.get('problemTotalRating') or 0),
-                    'story': float(data.get('storyTotalRating') or 0),
-                    'interior': float(data.get('interiorTotalRating') or 0),
-                    'act': float(data.get('actTotalRating') or 0),
-                    'score': score
-                })
-
-            candidates.sort(key=lambda x: x['score'], reverse=True)
+                candidates.append((score, doc.id, data))
+
+            candidates.sort(key=lambda x: x[0], reverse=True)
             
             if log_func: log_func(f"   -> [Vector] {len(candidates)}개 후보 중 Top {limit} 추출")
-            return candidates[:limit]
+            # 상위 limit개만 Theme으로 (카탈로그가 있으면 공유 레코드 참조)
+            return catalog_records(self.catalog, [(doc_id, data) for _, doc_id, data in candidates[:limit]])
 
         except Exception as e:
             if log_func: log_func(f"   ❌ [Error] Vector Search 실패: {e}")
             return []
 
-    def recommend_by_text(self, query_text, filters=None, exclude_ids=None, log_func=None):
+    def recommend_by_text(self, query_text, limit=10, filters=None, exclude_ids=None, log_func=None):
         if not self.model: return []
         if log_func: log_func(f"[Text] '{query_text}' 임베딩 검색 시작")
-        query_vector = self.model.encode(query_text).tolist()
-        return self._execute_vector_search(query_vector, limit=10, filters=filters, exclude_ids=exclude_ids, log_func=log_func)
+        # 동시 요청은 인코더 큐에서 한 배치로 묶어서 처리
+        encoder = self.encoder or self.model
+        query_vector = encoder.encode(query_text).tolist()
+        return self._execute_vector_search(query_vector, limit=limit, filters=filters, exclude_ids=exclude_ids, log_func=log_func)
+
+    def _serve_precomputed(self, user_context, fetch_limit, filters, exclude_ids, log_func=None):
+        if not self.topk_store: return None
+        if isinstance(user_context, list):
+            if len(user_context) != 1: return None
+            user_context = user_context[0]
+        if not isinstance(user_context, str) or ',' in user_context: return None
+        if filters and (filters.get('locations') or filters.get('min_rating') or filters.get('people_count')):
+            return None
+
+        items = self.topk_store.get(user_context.strip())
+        if items is None: return None
+
+        # 배치 이후(다른 프로세스 포함)에 기록된 플레이도 빠지도록 현재 플레이 기록으로 다시 거름
+        exclude = {str(x) for x in exclude_ids} if exclude_ids else set()
+        played = self.get_played_array(user_context)
+        if self.catalog is not None:
+            with self.catalog.lock:
+                exclude.update(str(self.catalog.doc_ids[row]) for row in self.catalog.rows_for_ref_ids(played).tolist())
+            # 카드 필드(평점 등)는 카탈로그의 최신 레코드를 그대로 참조
+            records = self.catalog.records_for_ids([item['id'] for item in items])
+        else:
+            records = [None] * len(items)
+        exclude.update(str(x) for x in played.tolist())
+
+        candidates = []
+        for item, record in zip(items, records):
+            if str(item['id']) in exclude: continue
+            candidates.append(record or Theme.from_card(item))
+            if len(candidates) >= fetch_limit: break
+        if len(candidates) < fetch_limit: return None
+
+        if log_func: log_func(f"   -> [Precomputed] 사전 계산 Top-K에서 {len(candidates)}개 로드")
+        return candidates
+
+    def _search_catalog(self, user_context, fetch_limit, filters, exclude_ids, log_func=None):
+        """카탈로그 임베딩 행렬 위에서 (멤버 x 테마) 행렬곱 한 번으로 그룹 점수 계산 -> 상위 fetch_limit개"""
+        members = self.get_member_matrix(user_context, log_func)
+        if members is None: return []
+        played = self.get_played_array(user_context, log_func)
+
+        with self.catalog.lock:
+            rows = np.flatnonzero(self.catalog.filter_mask(filters, exclude_ids, played) & self.catalog.has_embedding)
+            if not len(rows) or members.shape[1] != self.catalog.embeddings.shape[1]: return []
+            scores = group_scores(members, self.catalog.embeddings[rows], self.group_mode)
+            top = rows[top_k_order(scores, fetch_limit)]
+            candidates = [self.catalog.records[row] for row in top.tolist()]
+
+        if log_func: log_func(f"   -> [Vector] {len(members)}명 그룹 점수({self.group_mode})로 {len(rows)}개 중 Top {len(candidates)} 추출")
+        return candidates
 
     def recommend_by_user_search(self, user_context, user_query="", limit=3, filters=None, exclude_ids=None, log_func=None):
         if log_func: log_func(f"[Person] '{user_context}' 벡터 분석 (키워드: '{user_query}')")
         
-        target_vec = self.get_group_vector(user_context, log_func)
-        if not target_vec: return []
-        
-        played_ids = self._get_played_ids_internal(user_context, log_func)
-        final_exclude = set(exclude_ids) if exclude_ids else set()
-        final_exclude.update(played_ids)
-        
         fetch_limit = limit * 5 if user_query else limit
-        
-        candidates = self._execute_vector_search(target_vec, limit=fetch_limit, filters=filters, exclude_ids=final_exclude, log_func=log_func)
+
+        # 단일 유저 + 추가 필터 없음 -> 사전 계산 Top-K 테이블에서 바로 서빙
+        precomputed = self._serve_precomputed(user_context, fetch_limit, filters, exclude_ids, log_func)
+        if precomputed is not None:
+            candidates = precomputed
+            if user_query and candidates:
+                candidates = sort_candidates_by_query(candidates, user_query)
+            return candidates[:limit]
+
+        if self.catalog is not None and len(self.catalog):
+            candidates = self._search_catalog(user_context, fetch_limit, filters, exclude_ids, log_func)
+        else:
+            target_vec = self.get_group_vector(user_context, log_func)
+            if not target_vec: return []
+
+            played_ids = self._get_played_ids_internal(user_context, log_func)
+            final_exclude = set(exclude_ids) if exclude_ids else set()
+            final_exclude.update(played_ids)
+
+            candidates = self._execute_vector_search(target_vec, limit=fetch_limit, filters=filters, exclude_ids=final_exclude, log_func=log_func)
         
         if user_query and candidates:
             candidates = sort_candidates_by_query(candidates, user_query)
             if log_func: log_func(f"   -> [Re-rank] 키워드('{user_query}') 반영하여 재정렬 완료")
             
         return candidates[:limit]
+
+
+class HybridRecommender:
+    """
+    카탈로그 배열 위에서 한 번 만든 필터 마스크로
+    조건(평점/선호 키워드) 랭킹과 벡터 유사도 랭킹을 함께 계산하고,
+    Reciprocal Rank Fusion(RRF)으로 합친 단일 랭킹을 만듭니다.
+    """
+    def __init__(self, catalog, vector_recommender, rrf_k=60):
+        self.catalog = catalog
+        self.vector_recommender = vector_recommender
+        self.rrf_k = rrf_k
+
+    def _rule_order(self, rows, user_query):
+        """sort_candidates_by_query와 같은 기준의 정렬을 배열(lexsort)로 수행"""
+        spec = query_sort_spec(user_query)
+        # lexsort는 마지막 키가 1순위, 오름차순이므로 부호를 뒤집어 내림차순으로 정렬
+        keys = [-direction * self.catalog.field(field)[rows] for field, direction in reversed(spec)]
+        return rows[np.lexsort(keys)]
+
+    def _cards(self, rows):
+        """카탈로그의 Theme 레코드를 복사 없이 참조로 반환"""
+        records = self.catalog.records
+        return [records[row] for row in rows.tolist()]
+
+    def rank(self, filters, user_query="", user_context=None, exclude_ids=None, limit=3, vector_limit=None, log_func=None):
+        """
+        {'rule_based': [...], 'personalized': [...], 'hybrid': [...]}
+        - rule_based: 조건 랭킹 상위 limit개
+        - personalized: 유사도 순 상위 vector_limit개 (키워드 재정렬 전)
+        - hybrid: RRF 상위 limit개 (유저 벡터가 있을 때만)
+        """
+        vector_limit = vector_limit or limit
+        exclude = set(exclude_ids) if exclude_ids else set()
+
+        members, played = None, None
+        if user_context:
+            members = self.vector_recommender.get_member_matrix(user_context, log_func)
+            played = self.vector_recommender.get_played_array(user_context, log_func)
+
+        # 카탈로그 동기화와 섞이지 않도록 배열을 읽는 동안 잠금
+        with self.catalog.lock:
+            return self._rank_locked(filters, user_query, members, exclude, played, limit, vector_limit, log_func)
+
+    def _rank_locked(self, filters, user_query, members, exclude, played, limit, vector_limit, log_func=None):
+        rows = np.flatnonzero(self.catalog.filter_mask(filters, exclude, played))
+        if log_func: log_func(f"[Hybrid] 필터링 후 {len(rows)}개 후보 (단일 스캔)")
+
+        results = {}
+        if len(rows) == 0: return results
+
+        rule_rows = self._rule_order(rows, user_query)
+        results['rule_based'] = self._cards(rule_rows[:limit])
+
+        if members is None or members.shape[1] != self.catalog.embeddings.shape[1]: return results
+
+        # 멤버 x 테마 유사도를 한 번의 행렬곱으로 계산해 그룹 점수로 합침
+        vec_rows = rows[self.catalog.has_embedding[rows]]
+        sims = group_scores(members, self.catalog.embeddings[vec_rows], self.vector_recommender.group_mode)
+        vec_order = np.argsort(-sims, kind='stable')
+        results['personalized'] = self._cards(vec_rows[vec_order[:vector_limit]])
+
+        # RRF: 1/(k + 조건 순위) + 1/(k + 유사도 순위), 임베딩 없는 테마는 조건 항만 반영
+        fused = np.zeros(len(self.catalog), dtype=np.float64)
+        fused[rule_rows] += 1.0 / (self.rrf_k + np.arange(1, len(rule_rows) + 1))
+        fused[vec_rows[vec_order]] += 1.0 / (self.rrf_k + np.arange(1, len(vec_order) + 1))
+        fused_rows = rows[np.argsort(-fused[rows], kind='stable')][:limit]
+        results['hybrid'] = self._cards(fused_rows)
+
+        if log_func: log_func(f"   -> [Hybrid] 조건/유사도 랭킹을 RRF로 통합 (Top {len(fused_rows)})")
+        return results
@@ -0,0 +1,284 @@
+"""
+테마 / 유저 임베딩(embedding_field) 일괄 재생성 배치 작업.
+
+    python reembed.py                      # 테마 -> 유저 순서로 변경분만 재임베딩
+    python reembed.py --collections themes --force
+    python reembed.py --reset              # 체크포인트 무시하고 처음부터
+
+문서를 페이지 단위로 스트리밍해 로컬 모델로 큰 배치 인코딩(프로세스 풀)하고,
+BulkWriter(없으면 WriteBatch)로 embedding_field + 모델 이름을 함께 기록합니다.
+페이지를 쓸 때마다 마지막 문서 ID를 체크포인트에 저장하므로 중단돼도 이어서 실행되고,
+끝까지 마친 컬렉션은 다음 실행에서 처음부터 다시 훑습니다.
+임베딩 모델과 입력 텍스트 해시가 그대로인 문서는 건너뜁니다(--force로 전체 재생성).
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from database import firestore, Vector
+from catalog import ThemeCatalog
+from play_history import PLAYED_FIELDS, decode_played
+from config import EMBEDDING_MODEL_NAME, LOCAL_CACHE_DIR, REEMBED_CHECKPOINT_PATH, USER_REVIEW_FIELD
+
+EMBEDDING_MODEL_FIELD = 'embedding_model'
+EMBEDDING_HASH_FIELD = 'embedding_text_hash'
+COLLECTIONS = ['themes', 'users']
+
+# ==============================================================================
+# [입력 텍스트] 문서 -> 임베딩할 문자열
+# ==============================================================================
+def theme_text(data):
+    parts = [data.get('title'), data.get('store_name'), data.get('description')]
+    return "\n".join(str(p).strip() for p in parts if p and str(p).strip())
+
+
+def user_text(data):
+    """리뷰 필드(문자열 / 문자열 리스트 / {'text': ...} 리스트) -> 하나의 문자열"""
+    reviews = data.get(USER_REVIEW_FIELD)
+    if isinstance(reviews, str): reviews = [reviews]
+    texts = []
+    for review in reviews or []:
+        text = (review.get('text') or review.get('content')) if isinstance(review, dict) else review
+        if isinstance(text, str) and text.strip(): texts.append(text.strip())
+    return "\n".join(texts)
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+# ==============================================================================
+# [체크포인트] 컬렉션별 마지막 처리 문서 ID
+# ==============================================================================
+class ReembedCheckpoint:
+    """
+    {'model': 모델 이름, 'collections': {이름: {'last_id', 'done', 'written', 'skipped'}}}
+    done은 마지막 실행이 끝까지 갔는지(중단되지 않았는지)만 나타냅니다.
+    모델이 바뀌면 이전 진행 상황은 버리고 처음부터 다시 시작합니다.
+    """
+    def __init__(self, path=REEMBED_CHECKPOINT_PATH, model_name=EMBEDDING_MODEL_NAME):
+        self.path = path
+        self.model_name = model_name
+        self.state = {'model': model_name, 'collections': {}}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('model') == model_name: self.state = saved
+
+    def get(self, name):
+        return self.state['collections'].setdefault(name, {'last_id': None, 'done': False, 'written': 0, 'skipped': 0})
+
+    def save(self):
+        if not self.path: return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.state = {'model': self.model_name, 'collections': {}}
+        self.save()
+
+
+# ==============================================================================
+# [인코딩] 프로세스마다 모델을 한 번 로드하고 청크 단위로 나눠 인코딩
+# ==============================================================================
+_MODEL = None
+
+def _load_model(model_name, cache_dir):
+    from sentence_transformers import SentenceTransformer
+    os.makedirs(cache_dir, exist_ok=True)
+    return SentenceTransformer(model_name, cache_folder=cache_dir, model_kwargs={"use_safetensors": True})
+
+
+def _init_worker(model_name, cache_dir):
+    global _MODEL
+    _MODEL = _load_model(model_name, cache_dir)
+
+
+def _encode_chunk(args):
+    texts, batch_size = args
+    return np.asarray(_MODEL.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+class PoolEncoder:
+    """
+    texts -> (n x d) float32 행렬.
+    workers > 0이면 프로세스 풀에 chunk_size씩 나눠 보내고, 0이면 현재 프로세스의 model로 인코딩합니다.
+    """
+    def __init__(self, model=None, workers=None, chunk_size=512, batch_size=128,
+                 model_name=EMBEDDING_MODEL_NAME, cache_dir=LOCAL_CACHE_DIR):
+        self.model = model
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self._pool = None
+
+    def __enter__(self):
+        if self.workers != 0:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(self.model_name, self.cache_dir))
+        elif self.model is None:
+            self.model = _load_model(self.model_name, self.cache_dir)
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool: self._pool.shutdown()
+        self._pool = None
+
+    def encode(self, texts):
+        if not texts: return np.zeros((0, 0), dtype=np.float32)
+        if self._pool is None:
+            return np.asarray(self.model.encode(texts, batch_size=self.batch_size), dtype=np.float32)
+        chunks = [(texts[i:i + self.chunk_size], self.batch_size) for i in range(0, len(texts), self.chunk_size)]
+        return np.concatenate(list(self._pool.map(_encode_chunk, chunks)))
+
+
+# ==============================================================================
+# [쓰기] BulkWriter 우선, 없으면 400건 단위 WriteBatch
+# ==============================================================================
+def write_embeddings(db, updates, model_name=EMBEDDING_MODEL_NAME):
+    """updates: [(문서 참조, 벡터, 텍스트 해시), ...]"""
+    def payload(vector, digest):
+        return {
+            'embedding_field': Vector([float(x) for x in vector]),
+            EMBEDDING_MODEL_FIELD: model_name,
+            EMBEDDING_HASH_FIELD: digest,
+            # CatalogSync 폴링 모드가 변경분을 가져가도록
+            'updated_at': firestore.SERVER_TIMESTAMP,
+        }
+
+    if hasattr(db, 'bulk_writer'):
+        writer = db.bulk_writer()
+        for ref, vector, digest in updates:
+            writer.update(ref, payload(vector, digest))
+        writer.close()
+        return
+
+    batch = db.batch()
+    for i, (ref, vector, digest) in enumerate(updates, 1):
+        batch.update(ref, payload(vector, digest))
+        if i % 400 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+
+# ==============================================================================
+# [파이프라인] 페이지 스트리밍 -> 변경분 인코딩 -> 일괄 쓰기 -> 체크포인트
+# ==============================================================================
+def _stream_pages(db, name, fields, page_size, last_id=None):
+    collection = db.collection(name)
+    while True:
+        query = collection.select(fields).order_by('__name__')
+        if last_id: query = query.start_after({'__name__': collection.document(last_id)})
+        docs = list(query.limit(page_size).stream())
+        if not docs: return
+        yield docs
+        if len(docs) < page_size: return
+        last_id = docs[-1].id
+
+
+def _played_mean_vector(catalog, data):
+    """리뷰가 없는 유저: 플레이한 테마들의 (새) 임베딩 평균"""
+    if catalog is None: return None
+    rows = catalog.rows_for_ref_ids(decode_played(data))
+    rows = rows[catalog.has_embedding[rows]]
+    if not len(rows): return None
+    return catalog.embeddings[rows].mean(axis=0)
+
+
+def reembed_collection(db, name, encoder, checkpoint, catalog=None, page_size=2000, force=False, log_func=None):
+    """
+    name 컬렉션을 재임베딩하고 (기록, 건너뜀) 건수를 반환합니다.
+    users는 리뷰 텍스트가 있으면 인코딩하고, 없으면 catalog의 플레이 테마 임베딩 평균을 씁니다.
+    """
+    progress = checkpoint.get(name)
+    if progress['done']:
+        # 끝난 실행이면 처음부터 다시 훑음 (바뀌지 않은 문서는 모델/해시 비교로 건너뜀), 중단된 실행이면 이어서
+        progress.update(last_id=None, done=False, written=0, skipped=0)
+        checkpoint.save()
+    elif progress['last_id'] and log_func:
+        log_func(f"[Reembed] {name}: {progress['last_id']} 이후부터 이어서 실행")
+
+    is_theme = name == 'themes'
+    fields = ['title', 'store_name', 'description'] if is_theme else ['nickname', USER_REVIEW_FIELD] + PLAYED_FIELDS
+    fields += [EMBEDDING_MODEL_FIELD, EMBEDDING_HASH_FIELD]
+
+    started = time.time()
+    for docs in _stream_pages(db, name, fields, page_size, progress['last_id']):
+        to_encode, direct = [], []
+        for doc in docs:
+            data = doc.to_dict() or {}
+            text = theme_text(data) if is_theme else user_text(data)
+            if text:
+                digest = text_hash(text)
+            else:
+                vector = None if is_theme else _played_mean_vector(catalog, data)
+                if vector is None: continue
+                digest = text_hash("played:" + ",".join(map(str, decode_played(data).tolist())))
+
+            if not force and data.get(EMBEDDING_MODEL_FIELD) == checkpoint.model_name and data.get(EMBEDDING_HASH_FIELD) == digest:
+                progress['skipped'] += 1
+                continue
+            if text: to_encode.append((doc.reference, text, digest))
+            else: direct.append((doc.reference, vector, digest))
+
+        vectors = encoder.encode([text for _, text, _ in to_encode])
+        updates = [(ref, vec, digest) for (ref, _, digest), vec in zip(to_encode, vectors)] + direct
+        if updates: write_embeddings(db, updates, checkpoint.model_name)
+
+        progress['written'] += len(updates)
+        progress['last_id'] = docs[-1].id
+        checkpoint.save()
+        if log_func: log_func(f"[Reembed] {name}: {progress['written']}건 기록 / {progress['skipped']}건 유지 ({time.time() - started:.1f}s)")
+
+    progress['done'] = True
+    checkpoint.save()
+    return progress['written'], progress['skipped']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="테마/유저 임베딩 일괄 재생성 (재시작 가능)")
+    parser.add_argument("--collections", default="themes,users", help="처리할 컬렉션 (쉼표 구분, themes -> users 순)")
+    parser.add_argument("--page-size", type=int, default=2000, help="한 번에 읽고 쓰는 문서 수")
+    parser.add_argument("--chunk-size", type=int, default=512, help="프로세스 하나에 보내는 텍스트 수")
+    parser.add_argument("--batch-size", type=int, default=128, help="model.encode 배치 크기")
+    parser.add_argument("--workers", type=int, default=None, help="인코딩 프로세스 수 (0 = 현재 프로세스)")
+    parser.add_argument("--checkpoint", default=REEMBED_CHECKPOINT_PATH)
+    parser.add_argument("--force", action="store_true", help="모델/텍스트가 같아도 다시 임베딩")
+    parser.add_argument("--reset", action="store_true", help="체크포인트를 지우고 처음부터 실행")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.collections.split(",") if n.strip()]
+    unknown = set(names) - set(COLLECTIONS)
+    if unknown:
+        raise SystemExit(f"지원하지 않는 컬렉션: {', '.join(sorted(unknown))}")
+
+    from database import init_firebase
+    db = init_firebase()
+    if not db:
+        raise SystemExit("Firebase 연결 실패")
+
+    checkpoint = ReembedCheckpoint(args.checkpoint)
+    if args.reset: checkpoint.reset()
+
+    started = time.time()
+    with PoolEncoder(workers=args.workers, chunk_size=args.chunk_size, batch_size=args.batch_size) as encoder:
+        for name in sorted(names, key=COLLECTIONS.index):
+            # 유저 기본 벡터는 방금 갱신한 테마 임베딩에서 계산
+            catalog = ThemeCatalog.load(db, log_func=print) if name == 'users' else None
+            reembed_collection(db, name, encoder, checkpoint, catalog, args.page_size, args.force, log_func=print)
+    print(f"[Done] model={EMBEDDING_MODEL_NAME} ({time.time() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+from catalog import ThemeCatalog
+from loadtest import InMemoryFirestore
+
+
+def _catalog(themes):
+    db = InMemoryFirestore()
+    db.data['themes'] = themes
+    return ThemeCatalog.load(db)
+
+
+def _theme(ref_id, title):
+    return {'ref_id': ref_id, 'title': title, 'location': '강남', 'satisfyTotalRating': 4.0,
+            'embedding_field': [1.0, 0.0, 0.0]}
+
+
+def test_doc_id_colliding_with_other_ref_id():
+    # 'A'의 문서 ID "7"이 'B'의 ref_id 7과 같음 (행 순서를 바꿔도 결과가 같아야 함)
+    for order in (["7", "b"], ["b", "7"]):
+        themes = {"7": _theme(100, 'A'), "b": _theme(7, 'B')}
+        catalog = _catalog({doc_id: themes[doc_id] for doc_id in order})
+        row_a, row_b = catalog.doc_ids.index("7"), catalog.doc_ids.index("b")
+
+        assert [r.title if r else None for r in catalog.records_for_ids(["7", "b", "100"])] == ['A', 'B', None]
+        assert catalog.rows_for_ids(["7"]) == [row_a]
+        assert catalog.rows_for_ids([7]) == [row_b]
+        assert catalog.rows_for_ids(["100"]) == [row_a]
+
+        mask = catalog.filter_mask({}, exclude_ids=["7"])
+        assert not mask[row_a] and mask[row_b]
+
+
+def test_numeric_string_ref_id_matches_all_duplicate_rows():
+    catalog = _catalog({"x": _theme(5, 'X'), "y": _theme(5, 'Y'), "z": _theme(6, 'Z')})
+    rows = catalog.rows_for_ids(["5"])
+    assert sorted(catalog.doc_ids[r] for r in rows) == ["x", "y"]
+    assert sorted(catalog.rows_for_ref_ids([5]).tolist()) == rows
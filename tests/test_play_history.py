@@ -0,0 +1,38 @@
+from loadtest import InMemoryFirestore
+from play_history import (LEGACY_DROPPED_FIELD, LEGACY_PLAYED_FIELD, decode_played, encode_played,
+                          migrate_play_history, write_played)
+
+
+def _db(user):
+    db = InMemoryFirestore()
+    db.data['users'] = {'u1': user}
+    return db, db.collection('users').document('u1')
+
+
+def test_packed_field_is_authoritative_once_present():
+    assert decode_played({'played_packed': encode_played([1]), 'played': [1, 2]}).tolist() == [1]
+    assert decode_played({'played_packed': b'', 'played': [3]}).tolist() == []
+    assert decode_played({'played': [3, '2']}).tolist() == [2, 3]
+
+
+def test_write_moves_legacy_array_into_packed():
+    db, ref = _db({'nickname': 'kim', 'played': [1, 2]})
+    assert write_played(db, ref, 3, legacy_writes=False).tolist() == [1, 2, 3]
+    data = db.data['users']['u1']
+    assert decode_played(data).tolist() == [1, 2, 3]
+    # 호환 쓰기를 끄면 배열은 건드리지 않음
+    assert data[LEGACY_PLAYED_FIELD] == [1, 2]
+
+
+def test_drop_legacy_is_not_undone_by_later_writes():
+    db, ref = _db({'nickname': 'kim', 'played': [1, 2]})
+    write_played(db, ref, 3, legacy_writes=True)
+    assert db.data['users']['u1'][LEGACY_PLAYED_FIELD] == [1, 2, 3]
+
+    assert migrate_play_history(db, drop_legacy=True) == 1
+    data = db.data['users']['u1']
+    assert LEGACY_PLAYED_FIELD not in data and data[LEGACY_DROPPED_FIELD]
+
+    assert write_played(db, ref, 4, legacy_writes=True).tolist() == [1, 2, 3, 4]
+    assert write_played(db, ref, 1, played=False, legacy_writes=True).tolist() == [2, 3, 4]
+    assert LEGACY_PLAYED_FIELD not in db.data['users']['u1']
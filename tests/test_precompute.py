@@ -0,0 +1,37 @@
+import json
+import os
+
+from precompute import TopKStore
+
+
+def _write_file(path, catalog_version, users):
+    with open(path, "w", encoding='utf-8') as f:
+        json.dump({'catalog_version': catalog_version, 'users': users}, f)
+
+
+def test_local_store_reloads_rewritten_file(tmp_path):
+    path = str(tmp_path / "topk.json")
+    _write_file(path, "v1", {'kim': [{'title': '첫 배치'}]})
+    store = TopKStore("local", path)
+    assert store.get('kim') == [{'title': '첫 배치'}]
+
+    # 오프라인 배치가 같은 경로에 새 파일을 씀
+    _write_file(path, "v2", {'kim': [{'title': '두 번째 배치'}, {'title': '추가'}], 'lee': []})
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert store.get('kim') == [{'title': '두 번째 배치'}, {'title': '추가'}]
+    assert store.get('lee') == []
+
+
+def test_invalidate_survives_until_next_file(tmp_path):
+    path = str(tmp_path / "topk.json")
+    _write_file(path, "v1", {'kim': [{'title': 'a'}]})
+    store = TopKStore("local", path)
+    store.invalidate('kim')
+    assert store.get('kim') is None
+
+    _write_file(path, "v2", {'kim': [{'title': 'b'}]})
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert store.get('kim') == [{'title': 'b'}]
@@ -0,0 +1,45 @@
+from catalog import ThemeCatalog, UserIndex
+from loadtest import InMemoryFirestore
+from recommenders import HybridRecommender, RuleBasedRecommender, VectorRecommender
+
+
+def _group_db(n_members=12):
+    db = InMemoryFirestore()
+    db.data['themes'] = {
+        str(10000 + i): {'ref_id': 10000 + i, 'title': f"테마{i}", 'location': '강남', 'satisfyTotalRating': 5.0 - i * 0.1,
+                         'embedding_field': [1.0, i * 0.2, 0.0]}
+        for i in range(6)
+    }
+    db.data['users'] = {
+        f"u{m}": {'nickname': f"유저{m}", 'embedding_field': [1.0, 0.0, 0.0],
+                  # 12번째 멤버만 가장 잘 맞는(평점도 가장 높은) 테마를 이미 플레이
+                  'played': [10000] if m == n_members else []}
+        for m in range(1, n_members + 1)
+    }
+    return db, ", ".join(f"유저{m}" for m in range(1, n_members + 1))
+
+
+def test_large_group_excludes_themes_played_by_any_member():
+    db, group = _group_db()
+    catalog, user_index = ThemeCatalog.load(db), UserIndex.load(db)
+    vec_rec = VectorRecommender(db, None, user_index=user_index, catalog=catalog)
+
+    assert 10000 in vec_rec.get_played_array(group).tolist()
+    assert vec_rec.get_member_matrix(group).shape == (12, 3)
+
+    personalized = vec_rec.recommend_by_user_search(group, limit=3)
+    assert personalized and "10000" not in [t.id for t in personalized]
+
+    ranked = HybridRecommender(catalog, vec_rec).rank({}, user_context=group, limit=3)
+    for key, items in ranked.items():
+        assert "10000" not in [t.id for t in items], key
+
+    rule = RuleBasedRecommender(db, user_index=user_index, catalog=catalog).search_themes({}, nicknames=group, limit=3)
+    assert rule and "10000" not in [t.id for t in rule]
+
+
+def test_firestore_fallback_queries_every_member_in_chunks():
+    db, group = _group_db()
+    vec_rec = VectorRecommender(db, None)
+    assert 10000 in vec_rec.get_played_array(group).tolist()
+    assert vec_rec.get_member_matrix(group).shape == (12, 3)
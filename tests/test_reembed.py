@@ -0,0 +1,23 @@
+from loadtest import InMemoryFirestore, StubEmbedModel
+from reembed import EMBEDDING_HASH_FIELD, PoolEncoder, ReembedCheckpoint, reembed_collection
+
+
+def _run(db, path):
+    with PoolEncoder(model=StubEmbedModel(dim=8), workers=0) as encoder:
+        return reembed_collection(db, 'themes', encoder, ReembedCheckpoint(str(path)), page_size=2)
+
+
+def test_rerun_after_completed_run_writes_only_changed_documents(tmp_path):
+    db = InMemoryFirestore()
+    db.data['themes'] = {str(10000 + i): {'title': f"테마{i}", 'description': f"설명 {i}"} for i in range(5)}
+    path = tmp_path / "reembed.json"
+
+    assert _run(db, path) == (5, 0)
+    before = db.data['themes']['10003'][EMBEDDING_HASH_FIELD]
+
+    db.data['themes']['10003']['description'] = "바뀐 설명"
+    assert _run(db, path) == (1, 4)
+    assert db.data['themes']['10003'][EMBEDDING_HASH_FIELD] != before
+
+    # 바뀐 게 없으면 아무것도 쓰지 않음
+    assert _run(db, path) == (0, 5)
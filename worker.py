@@ -0,0 +1,216 @@
+"""
+추천 워커 프로세스 (호스트당 1개).
+
+    python worker.py --host 127.0.0.1 --port 8765
+
+임베딩 모델 / Firestore 클라이언트 / 카탈로그를 한 번만 로드하고
+모든 Streamlit 세션이 localhost HTTP로 generate_reply를 호출합니다.
+    GET  /health -> 상태, 처리 중/대기 중 요청 수
+    POST /reply  -> {"user_query", "user_context", "session_context", "profile"(선택)}
+                    profile=true면 이 워커 안에서 요청을 프로파일링해 응답에 "profile"을 담습니다.
+동시 처리 수는 워커 풀 크기로 제한되고, 대기열까지 가득 차면 503 + Retry-After로 거절합니다.
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from config import (
+    GROQ_API_KEY, TAVILY_API_KEY, RANKING_MODE, INTENT_CONFIDENCE_THRESHOLD, INTENT_MARGIN,
+    WORKER_HOST, WORKER_PORT, WORKER_MAX_CONCURRENCY, WORKER_MAX_QUEUE, WORKER_REQUEST_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def build_engine():
+    """워커/인프로세스 공용 엔진 구성. Firebase 연결 실패 시 None"""
+    from database import init_firebase
+    from models import load_embed_model, load_batching_encoder
+    from catalog import load_theme_catalog, load_user_index
+    from catalog_sync import load_catalog_sync
+    from precompute import load_topk_store
+    from caches import load_cursor_cache, load_result_cache
+    from recommenders import RuleBasedRecommender, VectorRecommender, HybridRecommender
+    from bot_engine import EscapeBotEngine
+    from intent_classifier import LocalIntentClassifier
+    from llm_scheduler import load_llm_scheduler
+
+    db = init_firebase()
+    if not db: return None
+    embed_model = load_embed_model()
+    catalog = load_theme_catalog(db)
+    user_index = load_user_index(db)
+    # 카탈로그/유저 인덱스를 변경 피드로 최신 상태 유지
+    load_catalog_sync(db, catalog, user_index)
+    topk_store = load_topk_store(db, catalog)
+
+    encoder = load_batching_encoder()
+    vec_rec = VectorRecommender(db, embed_model, topk_store=topk_store, encoder=encoder, user_index=user_index, catalog=catalog)
+    rule_rec = RuleBasedRecommender(db, user_index=user_index, catalog=catalog)
+    hybrid_rec = HybridRecommender(catalog, vec_rec) if RANKING_MODE == "hybrid" and catalog else None
+    return EscapeBotEngine(vec_rec, rule_rec, GROQ_API_KEY, TAVILY_API_KEY,
+                           cursor_cache=load_cursor_cache(), catalog=catalog, hybrid_recommender=hybrid_rec,
+                           intent_classifier=LocalIntentClassifier(embed_model, encoder, INTENT_CONFIDENCE_THRESHOLD, INTENT_MARGIN),
+                           llm_scheduler=load_llm_scheduler(), result_cache=load_result_cache())
+
+
+def json_default(obj):
+    """numpy 스칼라 / set / Theme 등 JSON 기본 인코더가 모르는 타입 처리"""
+    if isinstance(obj, np.generic): return obj.item()
+    if hasattr(obj, 'to_dict'): return obj.to_dict()
+    if isinstance(obj, (set, tuple)): return list(obj)
+    raise TypeError(f"JSON 직렬화 불가: {type(obj)}")
+
+
+class RecommendationWorker:
+    """엔진 하나 + 크기 제한된 스레드 풀 + 대기열 상한(백프레셔)"""
+    def __init__(self, engine, max_concurrency=WORKER_MAX_CONCURRENCY, max_queue=WORKER_MAX_QUEUE,
+                 request_timeout=WORKER_REQUEST_TIMEOUT):
+        self.engine = engine
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="reco")
+        self._slots = threading.BoundedSemaphore(max_concurrency + max_queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.served = 0
+        self.rejected = 0
+        self.started_at = time.time()
+
+    def health(self):
+        encoder = getattr(getattr(self.engine, 'vector_recommender', None), 'encoder', None)
+        scheduler = getattr(self.engine, 'llm_scheduler', None)
+        with self._lock:
+            return {
+                "encoder": encoder.stats() if encoder else None,
+                "llm": scheduler.stats() if scheduler else None,
+                "result_cache": self.engine.result_cache.stats() if self.engine else None,
+                "status": "ok" if self.engine else "degraded",
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "served": self.served,
+                "rejected": self.rejected,
+                "uptime": round(time.time() - self.started_at, 1),
+            }
+
+    def _run(self, payload):
+        logs = []
+        session_ctx = payload.get('session_context') or {}
+        session_ctx['shown_ids'] = set(session_ctx.get('shown_ids') or [])
+        args = (payload.get('user_query', ""),)
+        kwargs = {"user_context": payload.get('user_context'), "session_context": session_ctx, "on_log": logs.append}
+
+        profile = None
+        if payload.get('profile'):
+            from profiler import profile_call, profile_payload
+            result, prof = profile_call(self.engine.generate_reply, *args, **kwargs)
+            profile = profile_payload(prof)
+        else:
+            result = self.engine.generate_reply(*args, **kwargs)
+        reply_text, result_cards, used_filters, action, debug_info = result
+        return {
+            "profile": profile,
+            "reply_text": reply_text,
+            "result_cards": result_cards,
+            "used_filters": used_filters,
+            "action": action,
+            "debug_info": debug_info,
+            "logs": logs,
+        }
+
+    def _release(self, _future):
+        with self._lock: self.in_flight -= 1
+        self._slots.release()
+
+    def submit(self, payload):
+        """(HTTP 상태코드, 응답 딕셔너리)"""
+        if not self.engine:
+            return 503, {"error": "engine unavailable"}
+        if not self._slots.acquire(blocking=False):
+            with self._lock: self.rejected += 1
+            return 503, {"error": "busy"}
+
+        with self._lock: self.in_flight += 1
+        future = self.pool.submit(self._run, payload)
+        # 타임아웃으로 응답을 포기해도 작업이 끝날 때까지 슬롯을 점유합니다.
+        future.add_done_callback(self._release)
+        try:
+            result = future.result(timeout=self.request_timeout)
+        except FutureTimeout:
+            return 504, {"error": "timeout"}
+        except Exception as e:
+            logger.exception("generate_reply 실패")
+            return 500, {"error": str(e)}
+        with self._lock: self.served += 1
+        return 200, result
+
+
+def make_handler(worker):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body, headers=None):
+            data = json.dumps(body, ensure_ascii=False, default=json_default).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                health = worker.health()
+                self._send(200 if health["status"] == "ok" else 503, health)
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/reply":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except Exception:
+                self._send(400, {"error": "bad request"})
+                return
+            status, body = worker.submit(payload)
+            self._send(status, body, {"Retry-After": "1"} if status == 503 else None)
+
+        def log_message(self, fmt, *args):
+            logger.debug(fmt, *args)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="방탈출 추천 워커")
+    parser.add_argument("--host", default=WORKER_HOST)
+    parser.add_argument("--port", type=int, default=WORKER_PORT)
+    parser.add_argument("--concurrency", type=int, default=WORKER_MAX_CONCURRENCY)
+    parser.add_argument("--queue", type=int, default=WORKER_MAX_QUEUE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    engine = build_engine()
+    if not engine: logger.error("Firebase 연결 실패 - /health가 degraded로 응답합니다.")
+
+    worker = RecommendationWorker(engine, args.concurrency, args.queue)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(worker))
+    server.daemon_threads = True
+    logger.info(f"추천 워커 시작: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        worker.pool.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
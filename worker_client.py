@@ -0,0 +1,88 @@
+import json
+import time
+import urllib.error
+import urllib.request
+
+# ==============================================================================
+# [추천 워커 클라이언트] worker.py에 generate_reply를 위임 (표준 라이브러리만 사용)
+# ==============================================================================
+
+class WorkerUnavailable(Exception):
+    """워커에 연결할 수 없음 -> 인프로세스 엔진으로 대체"""
+
+
+class WorkerBusy(Exception):
+    """워커 대기열이 가득 참 (503)"""
+
+
+class WorkerError(Exception):
+    """워커에 연결은 됐지만 요청 처리 실패 (504 타임아웃 / 500 예외 등) -> 인프로세스로 재실행하지 않음"""
+
+
+class RemoteBotEngine:
+    """EscapeBotEngine.generate_reply와 같은 시그니처로 워커를 호출합니다."""
+    def __init__(self, base_url, timeout=60, health_ttl=5.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.health_ttl = health_ttl
+        self._health_checked_at = 0.0
+        self._healthy = False
+
+    def _request(self, path, payload=None, timeout=None):
+        data = json.dumps(payload, ensure_ascii=False, default=list).encode('utf-8') if payload is not None else None
+        req = urllib.request.Request(
+            self.base_url + path, data=data,
+            headers={"Content-Type": "application/json; charset=utf-8"},
+            method="POST" if data is not None else "GET",
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=timeout or self.timeout) as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 503: raise WorkerBusy(e.read().decode('utf-8', 'ignore'))
+            raise WorkerError(f"HTTP {e.code}")
+        except TimeoutError:
+            # 연결 후 응답을 기다리다 시간 초과 -> 워커는 살아 있으므로 연결 실패로 보지 않음
+            raise WorkerError("응답 시간 초과")
+        except ValueError as e:
+            raise WorkerError(f"잘못된 응답: {e}")
+        except (urllib.error.URLError, OSError) as e:
+            raise WorkerUnavailable(str(e))
+
+    def is_healthy(self):
+        """헬스 체크 결과를 health_ttl초 동안 재사용합니다."""
+        now = time.monotonic()
+        if now - self._health_checked_at < self.health_ttl:
+            return self._healthy
+        try:
+            self._healthy = self._request("/health", timeout=1).get("status") == "ok"
+        except (WorkerUnavailable, WorkerBusy, WorkerError):
+            self._healthy = False
+        self._health_checked_at = now
+        return self._healthy
+
+    def _reply(self, user_query, user_context, session_context, on_log, profile=False):
+        try:
+            body = self._request("/reply", {
+                "user_query": user_query,
+                "user_context": user_context,
+                "session_context": session_context or {},
+                "profile": profile,
+            })
+        except WorkerUnavailable:
+            self._healthy = False
+            raise
+
+        if on_log:
+            for line in body.get("logs", []): on_log(line)
+        return body
+
+    def generate_reply(self, user_query, user_context=None, session_context=None, on_log=None):
+        body = self._reply(user_query, user_context, session_context, on_log)
+        return body["reply_text"], body["result_cards"], body["used_filters"], body["action"], body["debug_info"]
+
+    def generate_profiled_reply(self, user_query, user_context=None, session_context=None, on_log=None):
+        """워커 안에서 프로파일링한 실행 -> (응답 튜플, 프로파일 딕셔너리 또는 None)"""
+        body = self._reply(user_query, user_context, session_context, on_log, profile=True)
+        result = (body["reply_text"], body["result_cards"], body["used_filters"], body["action"], body["debug_info"])
+        return result, body.get("profile")